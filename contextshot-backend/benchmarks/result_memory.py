@@ -0,0 +1,79 @@
+"""Per-item memory of stored batch results: Pydantic models vs dicts vs slotted records
+
+Run from contextshot-backend:  python benchmarks/result_memory.py --items 20000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pydantic import BaseModel
+
+from utils.results import ResultRecord
+
+
+class ProcessingResult(BaseModel):
+    # Mirrors main.ProcessingResult; main is not imported so the benchmark needs no client or .env
+    product_name: str
+    status: str
+    product_no_bg_url: Optional[str] = None
+    background_url: Optional[str] = None
+    final_image_url: Optional[str] = None
+    error: Optional[str] = None
+    processing_time: Optional[str] = None
+
+
+def sample_result(index: int) -> dict:
+    # Strings are built per item, as they are when decoded from the state backend or an API response
+    return {
+        'product_name': f"Product_{index + 1}",
+        'status': ''.join(['succ', 'ess']),
+        'product_no_bg_url': f"https://d1ei2xrl63k822.cloudfront.net/api/res/{index:08d}_rmbg.png?Expires=1767225600&Signature=abcdef{index}",
+        'background_url': None,
+        'final_image_url': f"https://d1ei2xrl63k822.cloudfront.net/api/res/{index:08d}_final.png?Expires=1767225600&Signature=012345{index}",
+        'error': None,
+        'processing_time': datetime(2026, 1, 1).isoformat()
+    }
+
+
+def measure(label: str, items: int, build) -> float:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = [build(sample_result(i)) for i in range(items)]
+    gc.collect()
+    per_item = (tracemalloc.get_traced_memory()[0] - baseline) / items
+    tracemalloc.stop()
+    del kept
+    print(f"{label:<32} {per_item:>10.0f} B/item")
+    return per_item
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"📏 In-memory footprint ({args.items} items, including URL strings)")
+    model = measure('ProcessingResult (Pydantic)', args.items, lambda d: ProcessingResult(**d))
+    measure('dict', args.items, lambda d: d)
+    record = measure('ResultRecord (__slots__)', args.items, ResultRecord.from_dict)
+    print(f"   ResultRecord saves {1 - record / model:.0%} vs Pydantic")
+
+    print("\n💾 Stored size per item (JSON in the state backend)")
+    keyed = sum(len(json.dumps(sample_result(i))) for i in range(args.items)) / args.items
+    row = sum(len(json.dumps(ResultRecord.from_dict(sample_result(i)).to_row(i))) for i in range(args.items)) / args.items
+    pending_keyed = len(json.dumps({'product_name': 'Product_1', 'status': 'pending'}))
+    pending_row = len(json.dumps(ResultRecord('Product_1', 'pending').to_row(0)))
+    print(f"{'keyed dict':<32} {keyed:>10.0f} B/item   (pending placeholder {pending_keyed} B)")
+    print(f"{'positional row':<32} {row:>10.0f} B/item   (pending placeholder {pending_row} B)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Cold-start benchmark: time to import main and to finish lifespan startup, with a budget
+
+Run from contextshot-backend:  python benchmarks/startup.py --runs 5 --budget-ms 1500
+Exits non-zero when the median startup exceeds the budget or a heavy dependency is
+imported before the worker is ready. tests/test_startup.py runs the same measurement under pytest.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '1500'))
+
+# Must not be loaded by the time the worker starts serving; they are imported on first use
+HEAVY_MODULES = ('numpy', 'PIL', 'anthropic', 'openai', 'requests')
+
+PROBE = f"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def probe():
+    async with main.lifespan(main.app):
+        ready = time.perf_counter()
+        print(json.dumps({{
+            'import_ms': (imported - started) * 1000,
+            'ready_ms': (ready - started) * 1000,
+            'heavy_loaded': sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)
+        }}))
+
+asyncio.run(probe())
+"""
+
+
+def run_probe(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, top: int):
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Direct imports of main are indented by exactly three spaces
+        if name.startswith('   ') and not name.startswith('    '):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(runs: int = 5, top: int = 0) -> dict:
+    """Median import and ready times over fresh subprocesses, plus any heavy modules loaded before ready"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # Isolated state so the benchmark never touches a real database, assets or pending jobs
+        env = {
+            **os.environ,
+            'STATE_BACKEND_URL': f"sqlite:///{os.path.join(tmp, 'state.db')}",
+            'ASSET_DIR': os.path.join(tmp, 'assets'),
+            'BRIA_CALLBACK_PUBLIC_URL': '',
+            'CASSETTE_MODE': ''
+        }
+        results = [run_probe(env) for _ in range(runs)]
+        slowest = slowest_imports(env, top) if top else []
+
+    return {
+        'runs': runs,
+        'import_ms': statistics.median(r['import_ms'] for r in results),
+        'ready_ms': statistics.median(r['ready_ms'] for r in results),
+        'heavy_loaded': sorted({m for r in results for m in r['heavy_loaded']}),
+        'slowest': slowest
+    }
+
+
+def budget_failures(result: dict, budget_ms: float) -> list:
+    failures = []
+    if result['ready_ms'] > budget_ms:
+        failures.append(f"startup {result['ready_ms']:.0f} ms exceeds budget {budget_ms:.0f} ms")
+    if result['heavy_loaded']:
+        failures.append(f"heavy modules imported before ready: {', '.join(result['heavy_loaded'])}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=8, help="show the slowest direct imports of main")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.top)
+
+    print(f"⏱️  import main:      {result['import_ms']:8.1f} ms (median of {args.runs})")
+    print(f"⏱️  ready to serve:   {result['ready_ms']:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if result['slowest']:
+        print("🐢 Slowest direct imports of main:")
+        for ms, name in result['slowest']:
+            print(f"   {ms:8.1f} ms  {name}")
+
+    failures = budget_failures(result, args.budget_ms)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Within startup budget")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
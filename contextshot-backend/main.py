@@ -1,14 +1,24 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
-import uvicorn
+from typing import Callable, List, Optional, Dict
 import os
 import logging
 import json
 import time
 import base64
 import asyncio
+import uuid
+import hashlib
+import importlib
+import multiprocessing
+import shutil
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -16,19 +26,143 @@ from dotenv import load_dotenv
 # Import ContextShot client
 import sys
 sys.path.append('..')
-from utils.contextshot_client import ContextShotClient
+from utils.admission import AdmissionController, AdmissionRejected, AdmissionSlot
+from utils.scheduler import UpstreamScheduler, SchedulerClosed, current_tenant
+from utils.state_backend import create_state_backend, SQLiteBackend
+from utils.batch_store import BatchStore, item_fingerprint
+from utils.results import ResultRecord
+from utils.jobs import PendingJobRegistry, job_context
+from utils.hedging import HedgePolicy
+from utils.accounting import UsageMeter, QuotaExceeded
+from utils.cassette import Cassette
+from utils.callbacks import CallbackRegistry, CallbackTimeout
+from utils.assets import AssetStore, AssetNotFound
+from utils.library import BackgroundLibrary
+from utils.compositing import Compositor, DEFAULT_PADDING, PLACEMENT_TYPES
+from utils.analysis import init_worker, spool, analyze_file
+from utils.fast_json import FastJSONResponse, parse_fields, project
+from utils.stats import StatsRecorder
+from utils.profiling import RequestTrace, request_trace, record_stage, trace_stage, instrument_logging
+from routers import admin, campaign
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
 logger = logging.getLogger(__name__)
+if admin.slow_requests.threshold > 0:
+    instrument_logging()
 
-# Global client instance
+# Global client instance, loaded in the background at startup (see start_client)
 contextshot_client = None
+client_ready: Optional[asyncio.Task] = None
+
+# Shared state (job status, counters, rate limits) visible to every worker process
+state = None
+batch_store = None
+job_registry = None
+usage_meter = None
+callbacks = None
+asset_store = None
+background_library = None
+
+# Local compositing of cached cutouts onto library backgrounds (composite mode of /upload/batch)
+compositor = Compositor(shadow_opacity=float(os.getenv('COMPOSITE_SHADOW_OPACITY', '0.35')))
+composite_pool: Optional[ThreadPoolExecutor] = None
+
+# Lifetime of signed asset URLs handed to Bria in URL-reference mode (ASSET_PUBLIC_URL set)
+ASSET_URL_TTL = float(os.getenv('ASSET_URL_TTL', '900'))
+
+# Render tiers of /generate/images: small fast drafts, or full 1200x1200 original-quality renders
+QUALITY_TIERS = ('draft', 'final')
+
+# Process pool for CPU-bound visual analysis (/analyze/batch), started on first use
+analysis_pool: Optional[ProcessPoolExecutor] = None
+ANALYZE_BATCH_MAX_FILES = int(os.getenv('ANALYZE_BATCH_MAX_FILES', '500'))
+
+# Each lifestyle shot is its own upstream call
+LIFESTYLE_MAX_RESULTS = int(os.getenv('LIFESTYLE_MAX_RESULTS', '8'))
+
+# Seconds a request waits for a Bria completion callback (callback mode only)
+CALLBACK_TIMEOUT = float(os.getenv('BRIA_CALLBACK_TIMEOUT', '300'))
+
+# Optional hedging of slow Bria replace_background calls (e.g. BRIA_HEDGE_PERCENTILE=0.95)
+hedge_policy = HedgePolicy(
+    percentile=float(os.getenv('BRIA_HEDGE_PERCENTILE')),
+    budget_ratio=float(os.getenv('BRIA_HEDGE_BUDGET', '0.1'))
+) if os.getenv('BRIA_HEDGE_PERCENTILE') else None
+
+# Part of every batch item's fingerprint; bump it when prompts, models or post-processing change
+# so that incremental re-runs regenerate items instead of carrying old results forward
+PIPELINE_VERSION = os.getenv('PIPELINE_VERSION', '1')
+
+# Oldest result (seconds since it was generated) an incremental re-run may carry forward;
+# Bria result URLs can be signed and expire, so older items are regenerated (0 disables the limit)
+INCREMENTAL_REUSE_MAX_AGE = float(os.getenv('INCREMENTAL_REUSE_MAX_AGE', '3600'))
+
+# Seconds between sweeps of expired shared-state keys (SQLite only removes them when read otherwise)
+STATE_SWEEP_INTERVAL = float(os.getenv('STATE_SWEEP_INTERVAL', '300'))
+
+# Seconds to wait on shutdown for in-flight upstream calls before handing them to the next process
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '30'))
+# Set when the shutdown signal arrives; the whole drain (uvicorn's and ours) shares this deadline
+drain_deadline: Optional[float] = None
+
+# Admission control: separate in-flight budgets for interactive and bulk endpoints
+admission = AdmissionController()
+admission.add_pool(
+    'interactive',
+    max_in_flight=int(os.getenv('ADMISSION_INTERACTIVE_MAX_IN_FLIGHT', '8')),
+    max_queue=int(os.getenv('ADMISSION_INTERACTIVE_MAX_QUEUE', '16')),
+    paths=['/context/preview', '/generate/images', '/generate/promote', '/generate/lifestyle'],
+    streamed=['/generate/lifestyle']
+)
+admission.add_pool(
+    'bulk',
+    max_in_flight=int(os.getenv('ADMISSION_BULK_MAX_IN_FLIGHT', '2')),
+    max_queue=int(os.getenv('ADMISSION_BULK_MAX_QUEUE', '4')),
+    paths=['/upload/batch', '/analyze/batch'],
+    streamed=['/analyze/batch']
+)
+
+# Every upstream Bria/Claude call goes through the priority scheduler
+upstream = UpstreamScheduler(
+    max_concurrency=int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '4')),
+    aging_seconds=float(os.getenv('UPSTREAM_AGING_SECONDS', '10'))
+)
+
+# Per-route and per-upstream-call throughput, success rate and latency over 1m/5m/1h windows
+stats = StatsRecorder()
+upstream.recorder = stats
+
+def begin_drain():
+    """Stop admitting work and start the drain clock; safe to call more than once"""
+    global drain_deadline
+    admission.draining = True
+    if drain_deadline is None:
+        drain_deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+
+def install_drain_signal_handlers():
+    """Begin draining on SIGINT/SIGTERM, chaining to uvicorn's handlers
+
+    uvicorn runs the lifespan shutdown only after it has closed its listeners and waited for
+    open connections, so draining from there would be too late for the 503 path.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        
+        def handler(signum, frame, previous=previous):
+            begin_drain()
+            previous(signum, frame)
+        
+        signal.signal(sig, handler)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup resources"""
-    global contextshot_client
+    global client_ready, state, batch_store, job_registry, usage_meter, asset_store, background_library, composite_pool, callbacks
     
     # Load environment variables
     env_paths = ['.env', '../.env', os.path.join(os.path.dirname(__file__), '.env')]
@@ -40,18 +174,137 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("⚠️ No .env file found")
     
-    # Initialize client
     api_token = os.getenv('BRIA_API_TOKEN')
     logger.info(f"🔍 API Token loaded: {api_token[:10]}..." if api_token else "❌ No API token")
-    if api_token:
-        contextshot_client = ContextShotClient(api_token)
-        logger.info("✅ ContextShot client initialized")
-        logger.info(f"🔍 Client API token: {contextshot_client.api_token[:10]}...")
-    else:
+    if not api_token:
         logger.error("❌ BRIA_API_TOKEN not found")
     
+    # Connect shared state so batch status and stats are consistent across workers
+    state = create_state_backend()
+    batch_store = BatchStore(state)
+    asset_store = AssetStore(
+        state,
+        os.getenv('ASSET_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')),
+        ttl_seconds=float(os.getenv('ASSET_TTL_SECONDS', str(24 * 3600))),
+        public_url=os.getenv('ASSET_PUBLIC_URL'),
+        url_secret=os.getenv('ASSET_URL_SECRET'),
+        # Asset files are per host; a multi-host backend also needs the bytes to be shared
+        share_bytes=os.getenv('ASSET_SHARE_BYTES', 'false' if isinstance(state, SQLiteBackend) else 'true').lower() == 'true'
+    )
+    if asset_store.public_url:
+        logger.info(f"🔗 URL-reference mode: Bria fetches images from {asset_store.public_url}/assets/.../shared")
+    expired_assets = asset_store.cleanup()
+    if expired_assets:
+        logger.info(f"🧹 Removed {expired_assets} expired product assets")
+    background_library = BackgroundLibrary(state, asset_store)
+    # PIL and NumPy release the GIL while resampling and blending, so threads composite in parallel
+    composite_pool = ThreadPoolExecutor(
+        max_workers=int(os.getenv('COMPOSITE_WORKERS', str(os.cpu_count() or 2))),
+        thread_name_prefix='composite'
+    )
+    upstream_rate_limit = int(os.getenv('UPSTREAM_RATE_LIMIT_PER_MINUTE', '0'))
+    if upstream_rate_limit > 0:
+        # Called off the event loop by the scheduler; Redis commands block on the socket
+        upstream.rate_limiter = lambda: state.allow('upstream', upstream_rate_limit, 60)
+        logger.info(f"🚦 Shared upstream rate limit: {upstream_rate_limit}/min")
+    
+    # Meter upstream spend and hold bulk work back before it eats the interactive budget
+    usage_meter = UsageMeter(
+        state,
+        unit_costs=json.loads(os.getenv('USAGE_UNIT_COSTS', '{}')),
+        daily_budget=float(os.getenv('USAGE_DAILY_BUDGET', '0')),
+        monthly_budget=float(os.getenv('USAGE_MONTHLY_BUDGET', '0')),
+        bulk_reserve=float(os.getenv('USAGE_BULK_RESERVE', '0.2'))
+    )
+    # Every upstream call is metered once, by the scheduler, whichever client method it uses
+    upstream.budget_gate = usage_meter.check_call
+    upstream.meter = usage_meter.record_call
+    
+    job_registry = PendingJobRegistry(state)
+    
+    # Opt-in callback mode: Bria notifies /callbacks/bria instead of being polled. The registry
+    # exists before the client loads, so callbacks for jobs submitted by other workers are not lost
+    callback_public_url = os.getenv('BRIA_CALLBACK_PUBLIC_URL')
+    if callback_public_url:
+        callbacks = CallbackRegistry(callback_public_url, state, secret=os.getenv('BRIA_CALLBACK_SECRET'))
+        logger.info(f"📮 Bria callback mode enabled: {callback_public_url}/callbacks/bria")
+    
+    # Record or replay upstream traffic (CASSETTE_MODE=record|replay) for offline reproduction
+    cassette = Cassette.from_env()
+    
+    # The client pulls in requests, PIL and LLM SDKs: load it in the background so the
+    # worker starts serving immediately; requests that need it wait in require_client()
+    background_tasks = [asyncio.create_task(sweep_state())]
+    if api_token:
+        client_ready = asyncio.create_task(start_client(api_token, cassette, background_tasks))
+    
+    install_drain_signal_handlers()
     yield
     logger.info("🔄 Shutting down ContextShot API")
+    
+    # Stop admitting work (normally already done by the signal), then give in-flight upstream
+    # calls whatever is left of the drain deadline
+    begin_drain()
+    upstream.close()
+    if await upstream.wait_idle(max(0.0, drain_deadline - time.monotonic())):
+        logger.info("✅ All in-flight upstream calls finished")
+    else:
+        logger.warning(f"⚠️ Drain deadline of {SHUTDOWN_DRAIN_TIMEOUT}s reached with {upstream.active_calls} upstream calls still running")
+    if client_ready and not client_ready.done():
+        client_ready.cancel()
+    for task in background_tasks:
+        task.cancel()
+    composite_pool.shutdown(wait=False, cancel_futures=True)
+    if analysis_pool:
+        analysis_pool.shutdown(wait=False, cancel_futures=True)
+    released = await asyncio.to_thread(job_registry.release_owned)
+    if released:
+        logger.info(f"💾 Persisted {released} pending Bria jobs for the next process")
+    if cassette:
+        cassette.close()
+        logger.info(f"📼 Cassette closed: {cassette.snapshot()}")
+
+async def sweep_state():
+    """Periodically drop expired shared-state keys (rate-limit windows, job claims, callbacks, batches)"""
+    while True:
+        await asyncio.sleep(STATE_SWEEP_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(state.sweep)
+            if removed:
+                logger.info(f"🧹 Swept {removed} expired shared-state keys")
+        except Exception as e:
+            logger.warning(f"⚠️ Shared-state sweep failed: {str(e)}")
+
+async def start_client(api_token: str, cassette: Optional[Cassette], background_tasks: List[asyncio.Task]):
+    """Import and wire up the ContextShot client off the event loop, then start its background work"""
+    global contextshot_client
+    started = time.perf_counter()
+    client_module = await asyncio.to_thread(importlib.import_module, 'utils.contextshot_client')
+    client = client_module.ContextShotClient(api_token)
+    client.job_registry = job_registry
+    client.usage_meter = usage_meter
+    client.stats = stats
+    if cassette:
+        client.cassette = cassette
+        client._generate_perfect_prompt_with_claude = cassette.wrap_call(
+            'claude_prompt', client._generate_perfect_prompt_with_claude
+        )
+    contextshot_client = client
+    logger.info(f"✅ ContextShot client initialized in {time.perf_counter() - started:.2f}s")
+    logger.info(f"🔍 Client API token: {contextshot_client.api_token[:10]}...")
+    
+    # Resume polling Bria jobs left unfinished by a previous process instead of resubmitting them
+    resumed = 0
+    for job in await asyncio.to_thread(job_registry.resumable):
+        if await asyncio.to_thread(job_registry.claim, job['request_id']):
+            background_tasks.append(asyncio.create_task(resume_pending_job(job)))
+            resumed += 1
+    if resumed:
+        logger.info(f"♻️ Resuming {resumed} pending Bria jobs")
+    
+    # Overdue callbacks are reconciled by polling, which needs the client
+    if callbacks:
+        background_tasks.append(asyncio.create_task(callbacks.run_reconciler(lambda status_url: client.check_job_status(status_url))))
 
 # Create FastAPI app
 app = FastAPI(
@@ -61,6 +314,82 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Bound concurrent work per endpoint class and shed excess load with 503"""
+    tenant = request.headers.get('X-Tenant-ID', 'default')
+    current_tenant.set(tenant)
+    trace = RequestTrace(request.method, request.url.path, tenant)
+    request_trace.set(trace)
+    started = time.monotonic()
+    response = await admit(request, call_next)
+    
+    def finish():
+        # Keyed by route template so /batch/{batch_id}/status is one metric, not one per batch
+        route = request.scope.get('route')
+        stats.record(f"http:{request.method} {getattr(route, 'path', 'unmatched')}", time.monotonic() - started, response.status_code < 500)
+        admin.slow_requests.finish(trace, response.status_code)
+    
+    body = getattr(response, 'body_iterator', None)
+    if body is None:
+        finish()
+    else:
+        # Streamed bodies do their work after the headers are sent, so time the request to its last chunk
+        response.body_iterator = finish_after_body(body, finish)
+    return response
+
+async def finish_after_body(body, finish: Callable[[], None]):
+    """Pass a response body through, calling finish() once it ends or the client goes away"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        finish()
+
+async def admit(request: Request, call_next):
+    pool = admission.pool_for(request.url.path)
+    if pool is None:
+        return await call_next(request)
+    
+    if admission.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is shutting down, please retry", "retry_after": 5},
+            headers={"Retry-After": "5"}
+        )
+    
+    if request.url.path in admission.streamed:
+        # The middleware would release the slot as soon as the response starts; these
+        # endpoints take it themselves (admission_slot) and release it when the body ends
+        return await call_next(request)
+    
+    try:
+        waiting = time.perf_counter()
+        async with pool.admit():
+            record_stage('admission_wait', waiting)
+            return await call_next(request)
+    except AdmissionRejected as e:
+        return capacity_response(request, e)
+
+def capacity_response(request: Request, e: AdmissionRejected) -> JSONResponse:
+    logger.warning(f"🚦 Rejected {request.url.path}: {str(e)}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is at capacity, please retry later", "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, e: AdmissionRejected):
+    return capacity_response(request, e)
+
+async def admission_slot(request: Request) -> AdmissionSlot:
+    """Take the admission slot of a streamed route; the caller releases it once the body is finished"""
+    waiting = time.perf_counter()
+    slot = await admission.pool_for(request.url.path).acquire()
+    record_stage('admission_wait', waiting)
+    return slot
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -70,6 +399,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(campaign.router)
+app.include_router(admin.router)
+
 # Pydantic models
 class ContextConfig(BaseModel):
     product_type: str = "product"
@@ -88,12 +420,13 @@ class ProcessingResult(BaseModel):
     error: Optional[str] = None
     processing_time: Optional[str] = None
 
-# In-memory storage
-processing_results: Dict[str, List[ProcessingResult]] = {}
-processing_status: Dict[str, str] = {}
-
-def validate_client():
-    """Validate client is initialized"""
+async def require_client():
+    """Wait for the background client load to finish and validate the client is initialized"""
+    if contextshot_client is None and client_ready is not None:
+        try:
+            await asyncio.shield(client_ready)
+        except Exception as e:
+            logger.error(f"❌ ContextShot client failed to load: {str(e)}")
     if not contextshot_client:
         raise HTTPException(status_code=500, detail="ContextShot client not initialized")
 
@@ -112,13 +445,14 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "bria_client_initialized": contextshot_client is not None,
-        "api_token_available": os.getenv('BRIA_API_TOKEN') is not None
+        "api_token_available": os.getenv('BRIA_API_TOKEN') is not None,
+        "admission": admission.snapshot()
     }
 
 @app.post("/upload/single")
 async def upload_single_product(file: UploadFile = File(...), context_config: str = Form(default="{}")):
     """Process a single product image"""
-    validate_client()
+    await require_client()
     validate_image_file(file)
     
     try:
@@ -144,89 +478,303 @@ async def upload_single_product(file: UploadFile = File(...), context_config: st
         logger.error(f"❌ Error processing single product: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def asset_url(request: Request, asset_id: str) -> str:
+    """Signed link to an asset's bytes, valid for as long as the asset itself is kept"""
+    return f"{str(request.base_url).rstrip('/')}/assets/{asset_id}/content?{asset_store.signed_query(asset_id, asset_store.ttl_seconds)}"
+
+async def library_background(context_config: Dict, seed: Optional[int]) -> Dict:
+    """Background for a context, generated by Bria only the first time its prompt + seed is seen"""
+    prompt = await contextshot_client._build_context_prompt(context_config, None)
+    
+    async def generate():
+        image_url = await upstream.run('batch', contextshot_client.generate_background, prompt, seed)
+        if not image_url:
+            raise Exception("No background returned by Bria")
+        return await asyncio.to_thread(contextshot_client.download_image, image_url)
+    
+    return await background_library.get_or_create('background', BackgroundLibrary.background_key(prompt, seed), generate)
+
+def render_composite(cutout_id: str, background_id: str, placement_type: str, padding: int) -> Dict:
+    """Runs in the compositing pool: blend a cached cutout onto a library background and store the result"""
+    content = compositor.composite(
+        asset_store.read(cutout_id), background_id, lambda: asset_store.read(background_id),
+        placement_type=placement_type, padding=padding
+    )
+    return asset_store.put(content, 'composite.jpg', 'image/jpeg')
+
+async def composite_product(request: Request, content: bytes, product_name: str, background: Dict,
+                            placement_type: str, padding: int) -> ResultRecord:
+    """Cut the product out once per distinct image, then composite it locally instead of a full generation"""
+    async def cut_out():
+        image_url = await upstream.run('batch', contextshot_client.remove_product_background, content)
+        return await asyncio.to_thread(contextshot_client.download_image, image_url)
+    
+    cutout = await background_library.get_or_create('cutout', BackgroundLibrary.cutout_key(content), cut_out)
+    with trace_stage('composite'):
+        final = await asyncio.get_running_loop().run_in_executor(
+            composite_pool, render_composite, cutout['asset_id'], background['asset_id'], placement_type, padding
+        )
+    return ResultRecord(
+        product_name, 'success',
+        product_no_bg_url=asset_url(request, cutout['asset_id']),
+        background_url=asset_url(request, background['asset_id']),
+        final_image_url=asset_url(request, final['asset_id']),
+        processing_time=datetime.now().isoformat()
+    )
+
 @app.post("/upload/batch")
-async def upload_batch_products(files: List[UploadFile] = File(...), context_config: ContextConfig = ContextConfig()):
-    """Process multiple product images in batch"""
-    validate_client()
+async def upload_batch_products(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    context_config: ContextConfig = ContextConfig(),
+    composite: bool = Form(False),
+    background_seed: Optional[int] = Form(None),
+    placement_type: str = Form('automatic'),
+    padding: int = Form(DEFAULT_PADDING),
+    previous_batch_id: Optional[str] = Form(None)
+):
+    """Process multiple product images in batch
+
+    With composite=true every product is placed on one shared library background: Bria is
+    called for one background per prompt + seed and one cutout per distinct image, and the
+    compositing runs locally.
+    
+    With previous_batch_id, items whose fingerprint (image hash, context config, pipeline)
+    matches a successful item of that batch are carried forward instead of reprocessed.
+    """
+    await require_client()
     
     for file in files:
         validate_image_file(file)
+    if composite and placement_type not in PLACEMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"placement_type must be one of {', '.join(PLACEMENT_TYPES)}")
+    if previous_batch_id and await asyncio.to_thread(batch_store.get_status, previous_batch_id) is None:
+        raise HTTPException(status_code=404, detail="Previous batch not found")
     
     try:
-        batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        processing_status[batch_id] = "processing"
-        processing_results[batch_id] = []
+        batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        await asyncio.to_thread(batch_store.create, batch_id, [f"Product_{i+1}" for i in range(len(files))])
+        await asyncio.to_thread(state.hincr, 'stats:api', 'batches_started')
         
         logger.info(f"🚀 Starting batch processing: {batch_id} with {len(files)} products")
         
+        # The product name is positional, so it is left out of the fingerprint; the output settings are in
+        pipeline = f"{PIPELINE_VERSION}:composite:{background_seed}:{placement_type}:{padding}" if composite else f"{PIPELINE_VERSION}:generate"
+        previous = await asyncio.to_thread(batch_store.get_fingerprinted, previous_batch_id, INCREMENTAL_REUSE_MAX_AGE) if previous_batch_id else {}
+        
+        background, background_error = None, None
         results = []
+        reused = 0
+        halted_reason = None
         for i, file in enumerate(files):
             try:
                 individual_config = context_config.dict().copy()
                 individual_config['product_name'] = f"Product_{i+1}"
                 
-                result = contextshot_client.process_single_product(file.file, individual_config)
-                results.append(ProcessingResult(**result))
-                processing_results[batch_id].append(ProcessingResult(**result))
+                content = await file.read()
+                await file.seek(0)
+                fingerprint = item_fingerprint(hashlib.sha256(content).hexdigest(), context_config.dict(), pipeline)
+                
+                job_context.set({'batch_id': batch_id, 'index': i, 'product_name': f"Product_{i+1}"})
+                generated_at = None
+                if fingerprint in previous:
+                    # Unchanged since the previous run: carry its result forward without any upstream call
+                    record, generated_at = previous[fingerprint]
+                    results.append(ResultRecord.from_dict({**record.to_dict(), 'product_name': f"Product_{i+1}"}))
+                    reused += 1
+                elif composite:
+                    # The library background is only needed once something actually has to be regenerated
+                    if background is None and background_error is None:
+                        try:
+                            background = await library_background(context_config.dict(), background_seed)
+                        except Exception as e:
+                            # Every remaining item fails (or halts, for quota) with this error instead of retrying
+                            logger.error(f"❌ Library background for {batch_id} failed: {str(e)}")
+                            background_error = e
+                    if background_error:
+                        raise background_error
+                    results.append(await composite_product(request, content, f"Product_{i+1}", background, placement_type, padding))
+                else:
+                    result = await upstream.run('batch', contextshot_client.process_single_product, file.file, individual_config)
+                    results.append(ResultRecord.from_dict(result))
+                await asyncio.to_thread(batch_store.set_result, batch_id, i, results[-1], fingerprint=fingerprint, generated_at=generated_at)
+                await asyncio.to_thread(state.hincr, 'stats:api', 'items_successful' if results[-1].status == 'success' else 'items_failed')
                 
                 logger.info(f"✅ Processed product {i+1}/{len(files)}")
                 
+            except asyncio.CancelledError:
+                # Shutdown cut the batch short (interrupted), or the client went away (cancelled);
+                # either way keep what finished
+                status = 'interrupted' if admission.draining else 'cancelled'
+                logger.warning(f"⚠️ Batch {batch_id} {status} at product {i+1}/{len(files)}")
+                resumable = None
+                if status == 'interrupted':
+                    # Only items with a persisted Bria job are resumed by the next process; the
+                    # uploads are gone, so items never submitted fail instead of waiting forever
+                    resumable = {
+                        job['context']['index'] for job in await asyncio.to_thread(job_registry.pending)
+                        if (job.get('context') or {}).get('batch_id') == batch_id
+                    }
+                await asyncio.to_thread(batch_store.mark_unfinished, batch_id, status, resumable)
+                raise
+            except QuotaExceeded as e:
+                # Stop spending on this batch; the remaining items are marked quota_exceeded. Once budget
+                # is available, rerun with previous_batch_id: finished items are carried forward, the rest regenerated
+                logger.warning(f"💸 Batch {batch_id} halted at product {i+1}/{len(files)}: {str(e)}")
+                halted_reason = str(e)
+                await asyncio.to_thread(batch_store.mark_unfinished, batch_id, 'quota_exceeded')
+                break
             except Exception as e:
                 logger.error(f"❌ Failed to process product {i+1}: {str(e)}")
-                error_result = ProcessingResult(
-                    product_name=f"Product_{i+1}",
-                    status="failed",
-                    error=str(e)
-                )
+                error_result = ResultRecord(f"Product_{i+1}", "failed", error=str(e))
                 results.append(error_result)
-                processing_results[batch_id].append(error_result)
+                await asyncio.to_thread(batch_store.set_result, batch_id, i, error_result)
+                await asyncio.to_thread(state.hincr, 'stats:api', 'items_failed')
         
-        processing_status[batch_id] = "completed"
-        logger.info(f"🎉 Batch processing completed: {batch_id}")
+        if halted_reason is None:
+            await asyncio.to_thread(batch_store.set_status, batch_id, "completed")
+            logger.info(f"🎉 Batch processing completed: {batch_id}")
+        if previous_batch_id:
+            logger.info(f"♻️ Batch {batch_id}: reused {reused} results from {previous_batch_id}, regenerated {len(results) - reused}")
         
         return {
             "batch_id": batch_id,
-            "results": results,
+            "previous_batch_id": previous_batch_id,
+            "reused": reused,
+            "regenerated": len(results) - reused,
+            "results": [ProcessingResult(**r.to_dict()) for r in results],
             "total_processed": len(files),
             "successful": len([r for r in results if r.status == "success"]),
-            "failed": len([r for r in results if r.status == "failed"])
+            "failed": len([r for r in results if r.status == "failed"]),
+            "halted_reason": halted_reason,
+            "usage": (await asyncio.to_thread(usage_meter.report, batch_id))['batch']
         }
         
     except Exception as e:
         logger.error(f"❌ Error processing batch: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/batch/{batch_id}/status")
-async def get_batch_status(batch_id: str):
-    """Get batch processing status"""
-    if batch_id not in processing_status:
+def batch_response(request: Request, batch_id: str, fields: Optional[str], include_status: bool) -> Response:
+    """Serve batch status/results, answering unchanged polls with 304 before loading anything"""
+    status = batch_store.get_status(batch_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Batch not found")
     
-    return {
-        "batch_id": batch_id,
-        "status": processing_status[batch_id],
-        "results": processing_results.get(batch_id, [])
-    }
+    # The version is read before the results, so a racing update can only make the ETag stale, never the body
+    version = batch_store.get_version(batch_id)
+    etag = f'W/"{batch_id}-{version}-{hashlib.sha1((fields or "").encode()).hexdigest()[:8]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
+    content = {"batch_id": batch_id}
+    if include_status:
+        content["status"] = status
+    # Stored records were built from validated results, so they serialize without a Pydantic pass
+    content["results"] = batch_store.get_results(batch_id)
+    return FastJSONResponse(project(content, parse_fields(fields)), headers=headers)
 
-@app.get("/batch/{batch_id}/results")
-async def get_batch_results(batch_id: str):
+@app.get("/batch/{batch_id}/status", response_class=FastJSONResponse)
+async def get_batch_status(batch_id: str, request: Request, fields: Optional[str] = None):
+    """Get batch processing status"""
+    return await asyncio.to_thread(batch_response, request, batch_id, fields, include_status=True)
+
+@app.get("/batch/{batch_id}/results", response_class=FastJSONResponse)
+async def get_batch_results(batch_id: str, request: Request, fields: Optional[str] = None):
     """Get batch processing results"""
-    if batch_id not in processing_results:
-        raise HTTPException(status_code=404, detail="Batch not found")
+    return await asyncio.to_thread(batch_response, request, batch_id, fields, include_status=False)
+
+@app.get("/jobs/{request_id}")
+async def get_job(request_id: str):
+    """Get the status or persisted result of an asynchronous Bria job"""
+    job = await asyncio.to_thread(job_registry.get, request_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def resume_pending_job(job: Dict):
+    """Collect the result of a Bria job submitted by a previous process"""
+    request_id = job['request_id']
+    context = job.get('context') or {}
+    logger.info(f"♻️ Resuming Bria job {request_id}: {context}")
     
-    return {"batch_id": batch_id, "results": processing_results[batch_id]}
+    try:
+        image_url = await upstream.run('batch', contextshot_client.poll_job_status, job['status_url'])
+        result = {'image_url': image_url}
+    except (SchedulerClosed, asyncio.CancelledError):
+        return
+    except QuotaExceeded as e:
+        # Leave the job pending; it is picked up again once budget is available
+        logger.warning(f"💸 Not resuming job {request_id}: {str(e)}")
+        return
+    except Exception as e:
+        logger.error(f"❌ Resumed job {request_id} failed: {str(e)}")
+        result = None
+    
+    await asyncio.to_thread(job_registry.complete, request_id, result)
+    
+    # Fill the batch item the job belonged to
+    if context.get('batch_id') and context.get('index') is not None:
+        item = ResultRecord(
+            product_name=context.get('product_name') or f"Product_{context['index'] + 1}",
+            status="success" if result else "failed",
+            final_image_url=result['image_url'] if result else None,
+            error=None if result else "Resumed job failed",
+            processing_time=datetime.now().isoformat()
+        )
+        await asyncio.to_thread(batch_store.set_result, context['batch_id'], context['index'], item)
+        logger.info(f"✅ Resumed job {request_id} filled {context['batch_id']} item {context['index'] + 1}")
+        if await asyncio.to_thread(batch_store.complete_if_finished, context['batch_id']):
+            logger.info(f"🎉 Batch {context['batch_id']} completed by resumed jobs")
+
+@app.post("/callbacks/bria")
+async def bria_callback(request: Request, token: Optional[str] = None):
+    """Receive an asynchronous Bria job completion"""
+    if callbacks is None:
+        raise HTTPException(status_code=404, detail="Callback mode is not enabled")
+    if not callbacks.verify(token):
+        raise HTTPException(status_code=403, detail="Invalid callback token")
+    
+    payload = await request.json()
+    request_id = payload.get('request_id')
+    if not request_id:
+        raise HTTPException(status_code=400, detail="request_id is required")
+    
+    job_result = payload.get('result') or {}
+    image_url = job_result.get('image_url') or payload.get('image_url')
+    failed = str(payload.get('status', 'completed')).lower() == 'failed' or not image_url
+    completion = {
+        'status': 'failed' if failed else 'completed',
+        'image_url': image_url,
+        'seed': job_result.get('seed'),
+        'error': payload.get('error') or (None if image_url else "No image_url in callback")
+    }
+    matched = await asyncio.to_thread(callbacks.deliver, request_id, completion)
+    logger.info(f"📬 Callback for {request_id}: {completion['status']} (waiter in this worker: {matched})")
+    return {"received": True}
 
 @app.get("/stats")
 async def get_processing_stats():
     """Get processing statistics"""
-    validate_client()
-    return contextshot_client.get_processing_stats()
+    return {
+        **stats.snapshot(),
+        "shared": await asyncio.to_thread(state.hgetall, 'stats:api'),
+        "scheduler": upstream.snapshot(),
+        "hedging": hedge_policy.snapshot() if hedge_policy else None,
+        "callbacks": callbacks.snapshot() if callbacks else None,
+        "library": background_library.snapshot()
+    }
+
+@app.get("/usage")
+async def get_usage(batch_id: Optional[str] = None):
+    """Metered upstream usage and remaining budget, optionally for a single batch"""
+    return await asyncio.to_thread(usage_meter.report, batch_id)
 
 @app.post("/stats/reset")
 async def reset_stats():
     """Reset processing statistics"""
-    validate_client()
-    contextshot_client.reset_stats()
+    stats.reset()
+    await asyncio.to_thread(state.delete, 'stats:api')
     return {"message": "Statistics reset successfully"}
 
 @app.get("/context/preview")
@@ -253,7 +801,7 @@ async def preview_context_prompt(
     aspectRatio: Optional[str] = None
 ):
     """Preview generated context prompt with optional visual analysis integration"""
-    validate_client()
+    await require_client()
     
     try:
         logger.info(f"🔄 Generating fresh context prompt (timestamp: {timestamp})")
@@ -311,7 +859,9 @@ async def preview_context_prompt(
                 product_description = f"{product_type} product"
             
             # Use Claude AI to generate the perfect prompt from advanced parameters
-            final_prompt = await contextshot_client._generate_perfect_prompt_with_claude(
+            final_prompt = await upstream.run(
+                'interactive',
+                contextshot_client._generate_perfect_prompt_with_claude,
                 product_description=product_description,
                 context_config=context_config,
                 visual_context=parsed_visual_context
@@ -339,214 +889,248 @@ async def preview_context_prompt(
         logger.error(f"❌ Error generating context prompt: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def resolve_asset(file: Optional[UploadFile], asset_id: Optional[str]) -> Dict:
+    """Return metadata for a registered asset, registering the upload if no asset_id is given"""
+    if asset_id:
+        try:
+            return await asyncio.to_thread(asset_store.get, asset_id)
+        except AssetNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either file or asset_id is required")
+    validate_image_file(file)
+    content = await file.read()
+    return await asyncio.to_thread(asset_store.put, content, file.filename or '', file.content_type)
+
+@app.post("/assets")
+async def upload_asset(file: UploadFile = File(...)):
+    """Register a product image once; later lifestyle/reference calls can pass its asset_id"""
+    return await resolve_asset(file, None)
+
+def authorize_asset(asset_id: str, expires: Optional[int] = None, signature: Optional[str] = None,
+                    x_admin_token: Optional[str] = Header(None)):
+    """Asset reads need the signature from a URL this API handed out, or the admin token"""
+    if expires is not None and signature and asset_store.verify(asset_id, expires, signature):
+        return
+    if not admin.admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid or expired asset URL")
+
+async def asset_file(asset_id: str) -> FileResponse:
+    try:
+        asset = await asyncio.to_thread(asset_store.get, asset_id)
+    except AssetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(await asyncio.to_thread(asset_store.path, asset_id), media_type=asset['mime_type'])
+
+@app.get("/assets/{asset_id}/content", dependencies=[Depends(authorize_asset)])
+async def get_asset_content(asset_id: str):
+    """Image bytes of an asset, e.g. a library background, cutout or local composite"""
+    return await asset_file(asset_id)
+
+@app.get("/assets/{asset_id}/shared")
+async def get_shared_asset(asset_id: str, expires: int, signature: str):
+    """Asset bytes behind a signed, expiring URL; this is what Bria fetches in URL-reference mode"""
+    if not asset_store.verify(asset_id, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired asset URL")
+    return await asset_file(asset_id)
+
+async def upstream_image(asset_id: str, data_url: bool = False) -> str:
+    """How an asset is sent to Bria: a signed URL in URL-reference mode, otherwise inline base64 (or a data URL)"""
+    if asset_store.public_url:
+        return await asyncio.to_thread(asset_store.signed_url, asset_id, ASSET_URL_TTL)
+    return await asyncio.to_thread(asset_store.data_url if data_url else asset_store.base64, asset_id)
+
+@app.get("/assets/{asset_id}", dependencies=[Depends(authorize_asset)])
+async def get_asset(asset_id: str):
+    """Metadata of a registered product image"""
+    return await resolve_asset(None, asset_id)
+
 @app.post("/generate/lifestyle")
 async def generate_lifestyle_shots(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
     lifestyle_prompt: str = Form(...),
-    num_results: int = Form(2)
+    num_results: int = Form(2),
+    asset_id: Optional[str] = Form(None),
+    stream: bool = Form(False)
 ):
     """Generate lifestyle product shots using Bria AI Product Lifestyle Shot by Text API"""
-    validate_image_file(file)
-    
+    slot = await admission_slot(request)
+    handed_off = False
     try:
-        logger.info(f"🎭 Generating lifestyle shots for: {file.filename}")
-        logger.info(f"🎭 Lifestyle prompt: {lifestyle_prompt}")
+        await require_client()
+        if not 1 <= num_results <= LIFESTYLE_MAX_RESULTS:
+            raise HTTPException(status_code=400, detail=f"num_results must be between 1 and {LIFESTYLE_MAX_RESULTS}")
+        asset = await resolve_asset(file, asset_id)
         
-        # Step 1: Convert product image to URL for lifestyle generation
-        logger.info("🔄 Step 1: Preparing product image for lifestyle generation...")
+        logger.info(f"🎭 Generating {num_results} lifestyle shots for: {asset['filename']} ({asset['asset_id']})")
+        logger.info(f"🎭 Lifestyle prompt: {lifestyle_prompt}")
         
-        # For lifestyle shots, we want to use the original product image (with background)
-        # Convert the uploaded file to base64 and create a data URL
-        import base64
-        file.file.seek(0)
-        file_content = file.file.read()
-        file.file.seek(0)
+        # For lifestyle shots, we want to use the original product image (with background);
+        # the data URL is encoded once per asset and reused across re-runs
+        product_image_url = await upstream_image(asset['asset_id'], data_url=True)
+        job_context.set({'endpoint': '/generate/lifestyle', 'asset_id': asset['asset_id']})
         
-        # Get file extension
-        file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'jpg'
-        mime_type = f"image/{file_extension}"
+        async def generate_shot(index: int):
+            # One shot per upstream call, so variants run concurrently through the scheduler
+            try:
+                image_urls = await upstream.run(
+                    'interactive',
+                    contextshot_client.generate_lifestyle_shot_by_text,
+                    product_image_url,
+                    lifestyle_prompt,
+                    1
+                )
+                return index, (image_urls or [None])[0], None
+            except Exception as e:
+                return index, None, e
         
-        # Create data URL
-        base64_string = base64.b64encode(file_content).decode('utf-8')
-        product_image_url = f"data:{mime_type};base64,{base64_string}"
+        def format_shot(index: int, image_url: str) -> Dict:
+            return {
+                "image_url": image_url,
+                "shot_type": "lifestyle",
+                "prompt_used": lifestyle_prompt,
+                "variation": index + 1,
+                "generation_method": "Bria AI Lifestyle Shot (replace_background fallback)"
+            }
         
-        logger.info(f"✅ Product image prepared for lifestyle generation")
+        if stream:
+            async def shot_events():
+                # Started by the body itself, so a client that disconnects before or during the
+                # stream never leaves shots running
+                tasks = [asyncio.create_task(generate_shot(i)) for i in range(num_results)]
+                generated = 0
+                try:
+                    for next_shot in asyncio.as_completed(tasks):
+                        index, image_url, error = await next_shot
+                        if image_url:
+                            generated += 1
+                            event = {"asset_id": asset['asset_id'], **format_shot(index, image_url)}
+                        else:
+                            event = {"variation": index + 1, "error": str(error) if error else "No image generated"}
+                        yield json.dumps(event) + "\n"
+                    yield json.dumps({"done": True, "asset_id": asset['asset_id'], "total_generated": generated}) + "\n"
+                finally:
+                    # Client went away: stop queued variants from spending upstream calls
+                    for task in tasks:
+                        task.cancel()
+                    slot.release()
+            
+            handed_off = True
+            return StreamingResponse(shot_events(), media_type="application/x-ndjson")
         
-        # Step 2: Generate lifestyle shots using original product image
-        logger.info(f"Generating {num_results} lifestyle shots...")
-        lifestyle_images = contextshot_client.generate_lifestyle_shot_by_text(
-            product_image_url, 
-            lifestyle_prompt, 
-            num_results
-        )
+        shots = await asyncio.gather(*[generate_shot(i) for i in range(num_results)])
+        results = [format_shot(index, image_url) for index, image_url, _ in shots if image_url]
+        errors = [error for _, _, error in shots if error]
         
-        if not lifestyle_images:
+        if not results:
+            quota_errors = [e for e in errors if isinstance(e, QuotaExceeded)]
+            if quota_errors:
+                logger.warning(f"💸 Lifestyle generation rejected: {str(quota_errors[0])}")
+                raise HTTPException(status_code=429, detail=str(quota_errors[0]), headers={"Retry-After": str(quota_errors[0].retry_after)})
+            if errors:
+                logger.error(f"❌ Error generating lifestyle shots: {str(errors[0])}")
+                raise HTTPException(status_code=500, detail=str(errors[0]))
             logger.warning("⚠️ No lifestyle images generated")
             raise HTTPException(status_code=500, detail="Failed to generate lifestyle shots")
         
-        # Format response
-        results = []
-        for i, image_url in enumerate(lifestyle_images):
-            results.append({
-                "image_url": image_url,
-                "shot_type": "lifestyle",
-                "prompt_used": lifestyle_prompt,
-                "variation": i + 1,
-                "generation_method": "Bria AI Lifestyle Shot (replace_background fallback)"
-            })
-        
         logger.info(f"✅ Generated {len(results)} lifestyle shots")
         
         return {
             "success": True,
+            "asset_id": asset['asset_id'],
             "results": results,
             "total_generated": len(results),
             "generation_method": "Bria AI Product Lifestyle Shot by Text",
             "processing_time": "~15-30 seconds per shot"
         }
-        
-    except Exception as e:
-        logger.error(f"❌ Error generating lifestyle shots: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-def _calculate_ctr(variation: dict, config: dict) -> float:
-    """Calculate realistic CTR based on variation type and context"""
-    base_ctr = variation['base_ctr']
-    
-    # Adjust based on season
-    season_multipliers = {
-        'Spring': 1.05, 'Summer': 1.10, 'Fall': 1.08, 'Winter': 1.02
-    }
-    season_mult = season_multipliers.get(config.get('season', 'Spring'), 1.0)
-    
-    # Adjust based on demographic
-    demographic_multipliers = {
-        'Gen Z': 1.15, 'Millennials': 1.08, 'Gen X': 1.05, 'Baby Boomers': 1.02
-    }
-    demo_mult = demographic_multipliers.get(config.get('demographic', 'Millennials'), 1.0)
-    
-    # Adjust based on setting
-    setting_multipliers = {
-        'Urban': 1.08, 'Suburban': 1.05, 'Rural': 1.03, 'Coastal': 1.12, 'Mountain': 1.10
-    }
-    setting_mult = setting_multipliers.get(config.get('setting', 'Urban'), 1.0)
-    
-    calculated_ctr = base_ctr * season_mult * demo_mult * setting_mult
-    return round(calculated_ctr, 3)
+    finally:
+        if not handed_off:
+            slot.release()
 
-def _calculate_engagement(variation: dict, config: dict) -> float:
-    """Calculate realistic engagement score based on variation and context"""
-    base_engagement = variation['base_engagement']
-    
-    # Adjust based on style
-    style_multipliers = {
-        'professional': 1.0, 'modern': 1.05, 'minimalist': 1.08, 'luxury': 1.12, 'casual': 1.03
-    }
-    style_mult = style_multipliers.get(config.get('style', 'professional'), 1.0)
-    
-    # Add small random variation for realism
-    import random
-    random_factor = random.uniform(0.95, 1.05)
-    
-    calculated_engagement = base_engagement * style_mult * random_factor
-    return round(calculated_engagement, 1)
 
-def _calculate_brand_match(variation: dict, config: dict, index: int) -> float:
-    """Calculate brand match score based on variation relevance and order"""
-    base_score = 0.95
-    
-    # Decrease slightly for later variations (less priority)
-    order_penalty = index * 0.015
+async def replace_background(priority: str, image_base64: str, prompt: str, seed: Optional[int] = None,
+                             draft: bool = False) -> Optional[Dict]:
+    """Replace a product background, waiting on a Bria callback instead of a polling thread when enabled"""
+    # Only passed when drafting, so clients without the draft tier keep working for full renders
+    options = {'draft': True} if draft else {}
+    if callbacks is None:
+        def call():
+            return upstream.run(
+                priority,
+                contextshot_client.replace_product_background_enhanced,
+                image_base64, prompt, seed=seed, **options
+            )
+        
+        if hedge_policy:
+            # A hedged duplicate reuses the same seed, so deterministic requests yield the same image
+            result = await hedge_policy.run(call)
+        else:
+            result = await call()
+        if not result:
+            return None
+    else:
+        # Only the submission holds an upstream slot; the wait for completion is free
+        submitted = await upstream.run(
+            priority,
+            contextshot_client.submit_replace_background,
+            image_base64, prompt, seed, callbacks.callback_url, **options
+        )
+        if 'image_url' in submitted:
+            result = submitted
+        else:
+            request_id = submitted['request_id']
+            await asyncio.to_thread(job_registry.register, request_id, submitted['status_url'])
+            try:
+                result = await callbacks.wait(request_id, submitted['status_url'], timeout=CALLBACK_TIMEOUT)
+            except CallbackTimeout:
+                # Record the job as failed, so it is not left pending and resumed by every later process
+                await asyncio.to_thread(job_registry.complete, request_id, None)
+                raise
+            if result.get('status') == 'failed':
+                logger.error(f"❌ Bria job {request_id} failed: {result.get('error')}")
+                await asyncio.to_thread(job_registry.complete, request_id, None)
+                return None
+            await asyncio.to_thread(job_registry.complete, request_id, {'image_url': result['image_url']})
     
-    # Adjust based on variation type relevance
-    relevance_scores = {
-        'Lifestyle': 0.95, 'Commercial': 0.98, 'Editorial': 0.92, 
-        'Minimalist': 0.90, 'Luxury': 0.88, 'Outdoor': 0.85
+    return {
+        'image_url': result['image_url'],
+        'seed': result.get('seed') if result.get('seed') is not None else seed,
+        'prompt': prompt,
+        'refined_prompt': prompt
     }
-    relevance_score = relevance_scores.get(variation['name'], 0.90)
-    
-    calculated_score = base_score - order_penalty + (relevance_score - 0.90)
-    return round(max(0.70, min(0.98, calculated_score)), 2)
 
-@app.post("/generate/images")
-async def generate_images(file: UploadFile = File(...), context_config: str = Form(...)):
+@app.post("/generate/images", response_class=FastJSONResponse)
+async def generate_images(file: UploadFile = File(...), context_config: str = Form(...), fields: Optional[str] = None):
     """Generate product images with new backgrounds using Bria AI"""
-    validate_client()
+    await require_client()
     validate_image_file(file)
     
     try:
+        usage = usage_meter.begin_scope()
         config = json.loads(context_config)
         prompt = config.get('prompt', '')
         num_images = min(config.get('num_images', 6), 6)  # Pro plan: up to 6 images for demo
+        # 'draft' renders small, fast previews on the 'draft' scheduler class, full renders use 'final';
+        # promote a chosen draft to full quality with /generate/promote
+        quality = config.get('quality', 'final')
+        draft = quality == 'draft'
         
         if not prompt:
             raise HTTPException(status_code=400, detail="Prompt is required")
+        if quality not in QUALITY_TIERS:
+            raise HTTPException(status_code=400, detail=f"quality must be one of {', '.join(QUALITY_TIERS)}")
         
         logger.info(f"🎨 Processing product image: {file.filename}")
         logger.info(f"🎨 Context prompt: '{prompt[:50]}...'")
         
-        # Enhanced contextual variations with realistic metrics calculation
-        context_variations = [
-            {
-                'name': 'Lifestyle',
-                'prompt_suffix': 'lifestyle photography',
-                'use_case': 'Social Media',
-                'base_ctr': 0.045,
-                'base_engagement': 8.2,
-                'cost_per_hour': 75,
-                'hours_per_shot': 3
-            },
-            {
-                'name': 'Commercial',
-                'prompt_suffix': 'commercial photography',
-                'use_case': 'E-commerce',
-                'base_ctr': 0.038,
-                'base_engagement': 7.8,
-                'cost_per_hour': 100,
-                'hours_per_shot': 2
-            },
-            {
-                'name': 'Editorial',
-                'prompt_suffix': 'editorial photography',
-                'use_case': 'Magazine',
-                'base_ctr': 0.042,
-                'base_engagement': 8.5,
-                'cost_per_hour': 150,
-                'hours_per_shot': 4
-            },
-            {
-                'name': 'Minimalist',
-                'prompt_suffix': 'minimalist photography',
-                'use_case': 'Website',
-                'base_ctr': 0.035,
-                'base_engagement': 7.2,
-                'cost_per_hour': 80,
-                'hours_per_shot': 2.5
-            },
-            {
-                'name': 'Luxury',
-                'prompt_suffix': 'luxury photography',
-                'use_case': 'Premium Brand',
-                'base_ctr': 0.052,
-                'base_engagement': 9.1,
-                'cost_per_hour': 200,
-                'hours_per_shot': 5
-            },
-            {
-                'name': 'Outdoor',
-                'prompt_suffix': 'outdoor photography',
-                'use_case': 'Outdoor Brand',
-                'base_ctr': 0.041,
-                'base_engagement': 8.7,
-                'cost_per_hour': 120,
-                'hours_per_shot': 3.5
-            }
-        ]
+        # Contextual variations from the precompiled catalog
+        context_variations = campaign.catalog.variations
         
-        # Step 1: Convert uploaded file to base64 for Bria AI API
+        # Step 1: Prepare the product image for Bria AI API: uploaded once and referenced by
+        # URL in URL-reference mode, otherwise base64-encoded once and sent inline
         logger.info("🔄 Step 1: Preparing product image for background replacement...")
         try:
-            import base64
             file.file.seek(0)
             file_content = file.file.read()
             file.file.seek(0)
@@ -555,8 +1139,15 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
             file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'jpg'
             mime_type = f"image/{file_extension}"
             
-            # Create base64 string
-            base64_string = base64.b64encode(file_content).decode('utf-8')
+            # Drafts register the upload so a chosen variation can be promoted by asset_id
+            asset = None
+            if asset_store.public_url or draft:
+                asset = await asyncio.to_thread(asset_store.put, file_content, file.filename or '', mime_type)
+            if asset_store.public_url:
+                image_ref = await asyncio.to_thread(asset_store.signed_url, asset['asset_id'], ASSET_URL_TTL)
+            else:
+                with trace_stage('base64'):
+                    image_ref = base64.b64encode(file_content).decode('utf-8')
             logger.info(f"✅ Product image prepared for background replacement")
         except Exception as e:
             logger.error(f"❌ Error preparing product image: {str(e)}")
@@ -566,7 +1157,7 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
         logger.info("🔄 Step 2: Analyzing visual content for enhanced prompts...")
         visual_context = None
         try:
-            visual_analysis = contextshot_client._analyze_visual_content(file, file.filename or "")
+            visual_analysis = await asyncio.to_thread(contextshot_client._analyze_visual_content, file, file.filename or "")
             if visual_analysis:
                 visual_context = visual_analysis
                 logger.info(f"✅ Visual analysis completed: {len(visual_context.get('objects', []))} objects detected")
@@ -608,7 +1199,9 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
             }
         
         # Generate perfect prompt using Claude AI
-        perfect_prompt = await contextshot_client._generate_perfect_prompt_with_claude(
+        perfect_prompt = await upstream.run(
+            'interactive',
+            contextshot_client._generate_perfect_prompt_with_claude,
             product_description, context_config, visual_context
         )
         logger.info(f"🎨 Generated simple prompt: {perfect_prompt}")
@@ -659,12 +1252,10 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
                 # Use enhanced replace background method with original image (unique seed for each variation)
                 logger.info(f"🔄 Calling replace_product_background_enhanced for {variation['name']}")
                 logger.info(f"🔄 Prompt: {full_prompt}")
-                logger.info(f"🔄 Base64 length: {len(base64_string)}")
+                logger.info(f"🔄 Image reference length: {len(image_ref)}")
                 
-                background_result = await asyncio.to_thread(
-                    contextshot_client.replace_product_background_enhanced,
-                    base64_string, full_prompt, seed=None
-                )
+                job_context.set({'endpoint': '/generate/images', 'variation': variation['name']})
+                background_result = await replace_background('draft' if draft else 'final', image_ref, full_prompt, seed=None, draft=draft)
                 
                 logger.info(f"🔄 Background result: {background_result}")
                 
@@ -678,9 +1269,9 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
                     logger.info(f"🖼️ Final image URL: {final_image_url}")
                     
                     # Calculate realistic metrics based on context and variation
-                    predicted_ctr = _calculate_ctr(variation, config)
-                    engagement_score = _calculate_engagement(variation, config)
-                    brand_match_score = _calculate_brand_match(variation, config, i)
+                    predicted_ctr = campaign.catalog.ctr(variation, config)
+                    engagement_score = campaign.catalog.engagement(variation, config)
+                    brand_match_score = campaign.catalog.brand_match(variation, i)
                     
                     generated_images.append({
                         'final_image': final_image_url,
@@ -694,16 +1285,20 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
                         'cost_saved': variation['cost_per_hour'] * variation['hours_per_shot'],
                         'time_saved_hours': variation['hours_per_shot'],
                         'seed': returned_seed,
-                        'refined_prompt': background_result.get('refined_prompt', full_prompt)
+                        'refined_prompt': background_result.get('refined_prompt', full_prompt),
+                        'quality': quality
                     })
                 else:
                     logger.error(f"❌ No background result for {variation['name']} variation")
                 
-                # Add delay between requests for rate limiting
-                if i < num_images - 1:
+                # Add delay between requests for rate limiting; drafts are small renders and are
+                # paced by the scheduler alone
+                if not draft and i < num_images - 1:
                     logger.info("⏳ Waiting 3 seconds between variations...")
-                    time.sleep(3)
+                    await asyncio.sleep(3)
                     
+            except QuotaExceeded:
+                raise
             except Exception as e:
                 logger.error(f"❌ Error generating variation {i+1}: {str(e)}")
         
@@ -750,14 +1345,16 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
         avg_ctr = sum(img['predicted_ctr'] for img in generated_images) / len(generated_images) if generated_images else 0
         avg_engagement = sum(img['engagement_score'] for img in generated_images) / len(generated_images) if generated_images else 0
         
-        # Calculate ROI based on actual costs vs AI generation cost
-        ai_generation_cost = len(generated_images) * 0.50  # $0.50 per AI-generated image
+        # Calculate ROI based on metered upstream spend (flat $0.50 per image when nothing was metered, e.g. mock mode)
+        ai_generation_cost = round(usage['cost'], 2) if usage.get('bria_call') else len(generated_images) * 0.50
         roi_percentage = ((total_cost_saved - ai_generation_cost) / ai_generation_cost * 100) if ai_generation_cost > 0 else 0
         
-        return {
+        return FastJSONResponse(project({
             "images": [img['final_image'] for img in generated_images],
             "detailed_results": generated_images,
             "prompt": prompt,
+            "quality": quality,
+            "asset_id": asset['asset_id'] if asset else None,
             "num_generated": len(generated_images),
             "generation_time": datetime.now().isoformat(),
             "total_cost_saved": total_cost_saved,
@@ -766,8 +1363,13 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
             "avg_ctr": round(avg_ctr, 3),
             "avg_engagement": round(avg_engagement, 1),
             "ai_generation_cost": ai_generation_cost
-        }
+        }, parse_fields(fields)))
         
+    except HTTPException:
+        raise
+    except QuotaExceeded as e:
+        logger.warning(f"💸 Image generation rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"❌ Error generating images: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -775,6 +1377,7 @@ async def generate_images(file: UploadFile = File(...), context_config: str = Fo
 @app.post("/analyze/product")
 async def analyze_product(file: UploadFile = File(...)):
     """Analyze product image and generate AI description using Bria AI Contextual Keyword Extraction"""
+    await require_client()
     validate_image_file(file)
     
     try:
@@ -791,7 +1394,7 @@ async def analyze_product(file: UploadFile = File(...)):
         logger.info(f"🔍 File filename: {file.filename}")
         logger.info(f"🔍 File content type: {file.content_type}")
         
-        keywords_result = await contextshot_client.extract_contextual_keywords(file)
+        keywords_result = await upstream.run('interactive', contextshot_client.extract_contextual_keywords, file)
         logger.info(f"🔍 Keywords result AI source: {keywords_result.get('ai_source', 'Unknown') if keywords_result else 'None'}")
         logger.info(f"🔍 Keywords result type: {type(keywords_result)}")
         
@@ -846,16 +1449,97 @@ async def analyze_product(file: UploadFile = File(...)):
         logger.error(f"❌ Error analyzing product: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_analysis_pool() -> ProcessPoolExecutor:
+    global analysis_pool
+    if analysis_pool is None:
+        workers = int(os.getenv('ANALYZE_WORKERS', str(os.cpu_count() or 2)))
+        # spawn, not fork: this process already runs threads (event loop, to_thread workers)
+        analysis_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(contextshot_client.api_token,)
+        )
+        logger.info(f"🧮 Started visual analysis pool with {workers} processes")
+    return analysis_pool
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request, files: List[UploadFile] = File(...)):
+    """Visual analysis of many images across a process pool, streamed back as NDJSON as items finish"""
+    slot = await admission_slot(request)
+    handed_off = False
+    try:
+        await require_client()
+        if len(files) > ANALYZE_BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_FILES} files per request")
+        for file in files:
+            validate_image_file(file)
+        
+        # Workers read spooled files by path; image bytes are never pickled between processes
+        spool_dir = tempfile.mkdtemp(prefix='analyze_', dir=os.getenv('ANALYZE_SPOOL_DIR'))
+        try:
+            paths = await asyncio.to_thread(spool, files, spool_dir)
+        except Exception as e:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            logger.error(f"❌ Error spooling files for analysis: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        logger.info(f"🔍 Analyzing {len(files)} images in the process pool")
+        pool = get_analysis_pool()
+        loop = asyncio.get_running_loop()
+        
+        async def analyze(index: int):
+            try:
+                return index, await loop.run_in_executor(pool, analyze_file, paths[index], files[index].filename or "", files[index].content_type), None
+            except Exception as e:
+                return index, None, e
+        
+        async def analysis_events():
+            global analysis_pool
+            started = time.monotonic()
+            succeeded = 0
+            tasks = [asyncio.create_task(analyze(i)) for i in range(len(files))]
+            try:
+                for next_item in asyncio.as_completed(tasks):
+                    index, result, error = await next_item
+                    event = {"index": index, "filename": files[index].filename}
+                    if result and result['visual_context']:
+                        succeeded += 1
+                        event.update(success=True, analysis_time=datetime.now().isoformat(), **result)
+                    else:
+                        if isinstance(error, BrokenProcessPool) and analysis_pool is pool:
+                            # A worker died; reap the broken pool and start a fresh one for the next request
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            analysis_pool = None
+                        event.update(success=False, error=str(error) if error else "Visual analysis failed")
+                    yield json.dumps(event) + "\n"
+                elapsed = time.monotonic() - started
+                logger.info(f"✅ Analyzed {succeeded}/{len(files)} images in {elapsed:.1f}s")
+                yield json.dumps({"done": True, "total": len(files), "succeeded": succeeded, "failed": len(files) - succeeded, "elapsed": round(elapsed, 3)}) + "\n"
+            finally:
+                # Client went away: drop queued items, then remove the spooled inputs
+                for task in tasks:
+                    task.cancel()
+                shutil.rmtree(spool_dir, ignore_errors=True)
+                slot.release()
+        
+        handed_off = True
+        return StreamingResponse(analysis_events(), media_type="application/x-ndjson")
+    finally:
+        if not handed_off:
+            slot.release()
+
 @app.post("/analyze/visual")
 async def analyze_visual_content(file: UploadFile = File(...)):
     """Comprehensive visual analysis endpoint for detailed image understanding"""
+    await require_client()
     validate_image_file(file)
     
     try:
         logger.info(f"🔍 Performing comprehensive visual analysis: {file.filename}")
         
-        # Get comprehensive visual analysis
-        visual_analysis = contextshot_client._analyze_visual_content(file, file.filename or "")
+        # Get comprehensive visual analysis (CPU-bound, so off the event loop)
+        visual_analysis = await asyncio.to_thread(contextshot_client._analyze_visual_content, file, file.filename or "")
         
         if not visual_analysis:
             logger.warning("⚠️ No visual analysis results")
@@ -897,12 +1581,51 @@ async def analyze_visual_content(file: UploadFile = File(...)):
             }
         }
 
+@app.post("/generate/promote")
+async def promote_draft(
+    seed: int = Form(...),
+    prompt: str = Form(...),
+    asset_id: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None)
+):
+    """Re-render a chosen draft (same product, prompt and seed) at full quality"""
+    await require_client()
+    asset = await resolve_asset(file, asset_id)
+    
+    logger.info(f"⬆️ Promoting draft of {asset['asset_id']} (seed {seed}) to full quality")
+    try:
+        image_ref = await upstream_image(asset['asset_id'])
+        job_context.set({'endpoint': '/generate/promote', 'asset_id': asset['asset_id']})
+        background_result = await replace_background('final', image_ref, prompt, seed=seed)
+    except QuotaExceeded as e:
+        logger.warning(f"💸 Draft promotion rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"❌ Error promoting draft: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error promoting draft: {str(e)}")
+    
+    if not background_result:
+        logger.error(f"❌ Failed to promote draft of {asset['asset_id']}")
+        raise HTTPException(status_code=500, detail="Failed to render full-quality image")
+    
+    logger.info(f"✅ Promoted draft of {asset['asset_id']} to full quality")
+    return {
+        "success": True,
+        "image_url": background_result['image_url'],
+        "seed": background_result['seed'],
+        "prompt": prompt,
+        "asset_id": asset['asset_id'],
+        "quality": "final"
+    }
+
 @app.post("/apply/reference-background")
 async def apply_reference_background(
-    file: UploadFile = File(...), 
-    reference_data: str = Form(...)
+    file: Optional[UploadFile] = File(None), 
+    reference_data: str = Form(...),
+    asset_id: Optional[str] = Form(None)
 ):
     """Apply a reference background to a new product image"""
+    await require_client()
     try:
         logger.info(f"🎨 Applying reference background to new image")
         
@@ -917,15 +1640,13 @@ async def apply_reference_background(
         logger.info(f"🎲 Using reference seed: {seed}")
         logger.info(f"📝 Using reference prompt: {prompt}")
         
-        # Convert uploaded image to base64
-        image_data = await file.read()
-        base64_string = base64.b64encode(image_data).decode('utf-8')
+        # Reuse the registered asset (its cached encoding, or a signed URL) rather than re-encoding the upload
+        asset = await resolve_asset(file, asset_id)
+        image_ref = await upstream_image(asset['asset_id'])
         
         # Apply the reference background using the stored seed
-        background_result = await asyncio.to_thread(
-            contextshot_client.replace_product_background_enhanced,
-            base64_string, prompt, seed=seed
-        )
+        job_context.set({'endpoint': '/apply/reference-background'})
+        background_result = await replace_background('reference', image_ref, prompt, seed=seed)
         
         if background_result:
             logger.info(f"✅ Successfully applied reference background")
@@ -936,15 +1657,27 @@ async def apply_reference_background(
                 "seed": background_result['seed'],
                 "prompt": background_result['prompt'],
                 "refined_prompt": background_result['refined_prompt'],
+                "asset_id": asset['asset_id'],
                 "message": "Reference background applied successfully"
             }
         else:
             logger.error(f"❌ Failed to apply reference background")
             raise HTTPException(status_code=500, detail="Failed to apply reference background")
             
+    except HTTPException:
+        raise
+    except QuotaExceeded as e:
+        logger.warning(f"💸 Reference background rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"❌ Error applying reference background: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error applying reference background: {str(e)}")
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, log_level="info")
\ No newline at end of file
+    import uvicorn
+    # WEB_CONCURRENCY > 1 runs multiple worker processes sharing state through STATE_BACKEND_URL
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=8000, reload=workers == 1, workers=workers, log_level="info",
+        timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_TIMEOUT)
+    )
\ No newline at end of file
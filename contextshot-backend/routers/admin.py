@@ -0,0 +1,79 @@
+import os
+import secrets
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from utils.profiling import ProfilerBusy, SamplingProfiler, SlowRequestLog
+
+
+def admin_token_valid(x_admin_token: Optional[str]) -> bool:
+    admin_token = os.getenv('ADMIN_TOKEN')
+    return bool(admin_token and x_admin_token and secrets.compare_digest(x_admin_token, admin_token))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, and then require it in X-Admin-Token"""
+    if not os.getenv('ADMIN_TOKEN'):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+profiler = SamplingProfiler(max_seconds=float(os.getenv('PROFILE_MAX_SECONDS', '300')))
+
+# Requests slower than SLOW_REQUEST_THRESHOLD_MS (0 disables) keep a per-stage trace
+slow_requests = SlowRequestLog(
+    threshold_ms=float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '5000')),
+    capacity=int(os.getenv('SLOW_REQUEST_LOG_SIZE', '50'))
+)
+
+
+@router.post("/profile")
+async def start_profile(seconds: float = 30, interval_ms: float = 10):
+    """Sample every thread's stack for `seconds`; download the result from /admin/profile/download"""
+    try:
+        profiler.start(seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.snapshot()
+
+
+@router.get("/profile")
+async def get_profile(top: int = 20):
+    """Progress of the current or last profile and its hottest frames"""
+    return profiler.snapshot(top)
+
+
+@router.delete("/profile")
+async def stop_profile():
+    """Stop the running profile early, keeping what was sampled so far"""
+    profiler.stop()
+    return profiler.snapshot()
+
+
+@router.get("/profile/download")
+async def download_profile():
+    """Collapsed stacks of the last finished profile (flamegraph.pl / speedscope format)"""
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Profile still running")
+    if not profiler.samples:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(profiler.started_at))}.folded"
+    return PlainTextResponse(profiler.collapsed(), headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/slow-requests")
+async def get_slow_requests(limit: Optional[int] = None, path: Optional[str] = None):
+    """Most recent slow request traces, newest first"""
+    return {
+        'threshold_ms': slow_requests.threshold * 1000,
+        'captured': slow_requests.captured,
+        'requests': slow_requests.recent(limit, path)
+    }
@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+import math
+import os
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from utils.campaign import CampaignCatalog, RANK_METRICS
+from utils.fast_json import FastJSONResponse
+
+router = APIRouter(prefix="/campaign", tags=["campaign"])
+
+# Variation definitions and metric multipliers, compiled once (override with CAMPAIGN_CATALOG_PATH)
+catalog = CampaignCatalog.load()
+
+# Upper bound on combinations scored by one /campaign/score request
+CAMPAIGN_SCORE_MAX_COMBINATIONS = int(os.getenv('CAMPAIGN_SCORE_MAX_COMBINATIONS', '100000'))
+
+
+class CampaignScoreRequest(BaseModel):
+    combinations: List[Dict] = []
+    grid: Optional[Dict[str, List]] = None
+    rank_by: str = "composite"
+    top_k: Optional[int] = Field(None, ge=1)
+
+
+@router.get("/catalog")
+async def get_campaign_catalog():
+    """Current variation catalog and its version"""
+    return catalog.snapshot()
+
+
+def _expand(request: CampaignScoreRequest) -> List[Dict]:
+    combinations = list(request.combinations)
+    if request.grid:
+        # Cartesian product of the listed values, e.g. {"variation": [...], "season": [...]}
+        keys = list(request.grid)
+        combinations += [dict(zip(keys, values)) for values in itertools.product(*(request.grid[k] for k in keys))]
+    return combinations
+
+
+def _score(request: CampaignScoreRequest) -> List[Dict]:
+    return catalog.rank(_expand(request), request.rank_by, request.top_k)
+
+
+@router.post("/score", response_class=FastJSONResponse)
+async def score_campaign(request: CampaignScoreRequest):
+    """Rank (variation, config) combinations before spending any generation credits"""
+    if request.rank_by not in RANK_METRICS:
+        raise HTTPException(status_code=400, detail=f"rank_by must be one of {', '.join(RANK_METRICS)}")
+    
+    # Sized from the grid's dimensions, so an oversized grid is rejected before it is expanded
+    total = len(request.combinations) + (math.prod(len(values) for values in request.grid.values()) if request.grid else 0)
+    if not total:
+        raise HTTPException(status_code=400, detail="Provide combinations or a grid to score")
+    if total > CAMPAIGN_SCORE_MAX_COMBINATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {CAMPAIGN_SCORE_MAX_COMBINATIONS} combinations per request")
+    
+    try:
+        results = await asyncio.to_thread(_score, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return FastJSONResponse({
+        "catalog_version": catalog.version,
+        "rank_by": request.rank_by,
+        "scored": total,
+        "results": results
+    })
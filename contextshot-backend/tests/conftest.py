@@ -0,0 +1,199 @@
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """In-process server speaking just enough of the Redis protocol for RedisBackend
+
+    Keeps strings, hashes and lists in dicts with millisecond expiries. `delays` maps a
+    command name to seconds to stall before replying (after applying it), and `applied`
+    counts every command the server executed, so tests can tell a replay from a retry.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.password = password
+        self.data = {}
+        self.expiry = {}
+        self.delays = {}
+        self.applied = []
+        self.lock = threading.Lock()
+        self.connections = []
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def drop_connections(self):
+        """Close every client connection, as a server restart would"""
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+        self.connections.clear()
+
+    def stop(self):
+        self.drop_connections()
+        self.shutdown()
+        self.server_close()
+
+    def _live(self, key):
+        if key in self.expiry and self.expiry[key] < time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, authed: bool, args):
+        name, args = args[0].upper(), args[1:]
+        if name == 'AUTH':
+            return ('+', 'OK') if args[0] == self.password else ('-', 'WRONGPASS invalid password')
+        if self.password and not authed:
+            return ('-', 'NOAUTH Authentication required')
+        self.applied.append(name)
+        if name == 'SELECT':
+            return ('+', 'OK')
+        if name == 'GET':
+            return ('$', self._live(args[0]))
+        if name == 'SET':
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if 'NX' in options and self._live(key) is not None:
+                return ('$', None)
+            self.data[key] = value
+            self.expiry.pop(key, None)
+            if 'PX' in options:
+                self.expiry[key] = time.time() + int(args[2 + options.index('PX') + 1]) / 1000
+            return ('+', 'OK')
+        if name == 'DEL':
+            removed = sum(1 for key in args if self.data.pop(key, None) is not None)
+            return (':', removed)
+        if name == 'PEXPIRE':
+            if self._live(args[0]) is None:
+                return (':', 0)
+            self.expiry[args[0]] = time.time() + int(args[1]) / 1000
+            return (':', 1)
+        if name == 'INCRBYFLOAT':
+            value = float(self._live(args[0]) or 0) + float(args[1])
+            self.data[args[0]] = repr(value)
+            return ('$', repr(value))
+        if name in ('HSET', 'HINCRBYFLOAT', 'HDEL', 'HGETALL'):
+            table = self._live(args[0])
+            if table is None:
+                table = self.data[args[0]] = {}
+            if name == 'HSET':
+                table[args[1]] = args[2]
+                return (':', 1)
+            if name == 'HINCRBYFLOAT':
+                table[args[1]] = repr(float(table.get(args[1], 0)) + float(args[2]))
+                return ('$', table[args[1]])
+            if name == 'HDEL':
+                return (':', 1 if table.pop(args[1], None) is not None else 0)
+            return ('*', [item for pair in table.items() for item in pair])
+        if name in ('RPUSH', 'LSET', 'LRANGE'):
+            items = self._live(args[0])
+            if items is None:
+                items = self.data[args[0]] = []
+            if name == 'RPUSH':
+                items.extend(args[1:])
+                return (':', len(items))
+            if name == 'LSET':
+                index = int(args[1])
+                if not -len(items) <= index < len(items):
+                    return ('-', 'ERR index out of range')
+                items[index] = args[2]
+                return ('+', 'OK')
+            start, stop = int(args[1]), int(args[2])
+            return ('*', items[start:None if stop == -1 else stop + 1])
+        return ('-', f"ERR unknown command '{name}'")
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections.append(self.connection)
+        authed = False
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            with self.server.lock:
+                kind, value = self.server.execute(authed, args)
+            if args[0].upper() == 'AUTH' and kind == '+':
+                authed = True
+            time.sleep(self.server.delays.get(args[0].upper(), 0))
+            try:
+                self.wfile.write(self._encode(kind, value))
+            except OSError:
+                return
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode('utf-8'))
+        return args
+
+    @classmethod
+    def _encode(cls, kind, value) -> bytes:
+        if kind in ('+', '-'):
+            return f"{kind}{value}\r\n".encode('utf-8')
+        if kind == ':':
+            return f":{value}\r\n".encode('utf-8')
+        if kind == '$':
+            if value is None:
+                return b'$-1\r\n'
+            data = value.encode('utf-8')
+            return b'$%d\r\n%s\r\n' % (len(data), data)
+        return b'*%d\r\n' % len(value) + b''.join(cls._encode('$', item) for item in value)
+
+
+@pytest.fixture
+def resp_server():
+    server = RespStandIn()
+    yield server
+    server.stop()
+
+
+ADMIN_TOKEN = 'test-admin-token'
+
+
+@pytest.fixture(scope='session')
+def app_client(tmp_path_factory):
+    """TestClient for the API in callback mode, with no Bria token (tests install client stand-ins)
+
+    The app's lifespan closes the upstream scheduler, so it runs once per test session.
+    """
+    state_dir = tmp_path_factory.mktemp('state')
+    patch = pytest.MonkeyPatch()
+    patch.setenv('STATE_BACKEND_URL', f"sqlite:///{state_dir / 'state.db'}")
+    patch.setenv('ASSET_DIR', str(state_dir / 'assets'))
+    patch.setenv('BRIA_CALLBACK_PUBLIC_URL', 'http://testserver')
+    patch.setenv('ADMIN_TOKEN', ADMIN_TOKEN)
+    patch.delenv('BRIA_API_TOKEN', raising=False)
+    patch.delenv('ASSET_URL_SECRET', raising=False)
+    patch.delenv('BRIA_CALLBACK_SECRET', raising=False)
+
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+    patch.undo()
@@ -0,0 +1,54 @@
+"""Budgets hold when calls that passed the early check are charged concurrently"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.accounting import QuotaExceeded, UsageMeter
+from utils.state_backend import SQLiteBackend
+
+
+def upload():
+    """Stands in for a metered Bria call"""
+
+
+@pytest.fixture
+def meter(tmp_path):
+    return UsageMeter(SQLiteBackend(str(tmp_path / 'state.db')), unit_costs={'bria_call': 1.0},
+                      daily_budget=10, bulk_reserve=0.5)
+
+
+def charge_concurrently(meter, priority, calls):
+    def attempt(_):
+        try:
+            meter.record_call(priority, upload)
+            return True
+        except QuotaExceeded:
+            return False
+
+    # Every call passes the early check before any of them is charged
+    for _ in range(calls):
+        meter.check_call(priority, upload)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return sum(pool.map(attempt, range(calls)))
+
+
+def test_concurrent_calls_cannot_overshoot_budget(meter):
+    assert charge_concurrently(meter, 'interactive', 25) == 10
+    assert meter.spent()['day'] == 10
+    with pytest.raises(QuotaExceeded):
+        meter.check_call('interactive', upload)
+
+
+def test_bulk_calls_stop_at_the_interactive_reserve(meter):
+    assert charge_concurrently(meter, 'batch', 25) == 5
+    assert meter.spent()['day'] == 5
+    # The reserve is still there for interactive work
+    meter.record_call('interactive', upload)
+    assert meter.spent()['day'] == 6
+
+
+def test_rejected_call_is_not_recorded(meter):
+    charge_concurrently(meter, 'interactive', 12)
+    report = meter.report()
+    assert report['today']['bria_call'] == 10
+    assert report['tenants'] == {'default': 10.0}
@@ -0,0 +1,92 @@
+"""AssetStore signed URLs and MIME types, and who may read /assets/{id}/content"""
+import io
+import time
+from urllib.parse import parse_qs
+
+import pytest
+from PIL import Image
+
+import main
+from conftest import ADMIN_TOKEN
+from utils.assets import AssetStore
+from utils.state_backend import SQLiteBackend
+
+
+def png_bytes(color=(200, 30, 30)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AssetStore(SQLiteBackend(str(tmp_path / 'state.db')), str(tmp_path / 'assets'))
+
+
+def signed(store, asset_id, ttl=900):
+    query = parse_qs(store.signed_query(asset_id, ttl))
+    return int(query['expires'][0]), query['signature'][0]
+
+
+def test_signed_query_verifies(store):
+    asset_id = store.put(png_bytes())['asset_id']
+    expires, signature = signed(store, asset_id)
+    assert store.verify(asset_id, expires, signature)
+    assert expires % 60 == 0
+    assert store.signed_query(asset_id) == store.signed_query(asset_id)
+
+
+def test_tampered_or_foreign_signature_is_rejected(store, tmp_path):
+    asset_id = store.put(png_bytes())['asset_id']
+    other_id = store.put(png_bytes((0, 0, 255)))['asset_id']
+    expires, signature = signed(store, asset_id)
+    assert not store.verify(asset_id, expires + 60, signature)
+    assert not store.verify(other_id, expires, signature)
+    assert not store.verify(asset_id, expires, signature[:-1] + ('0' if signature[-1] != '0' else '1'))
+    # Another deployment (another secret) cannot mint URLs for this one
+    foreign = AssetStore(SQLiteBackend(str(tmp_path / 'other.db')), str(tmp_path / 'other-assets'))
+    assert not store.verify(asset_id, *signed(foreign, asset_id))
+
+
+def test_expired_signature_is_rejected(store):
+    asset_id = store.put(png_bytes())['asset_id']
+    expires = int(time.time()) - 1
+    assert not store.verify(asset_id, expires, store._signature(asset_id, expires))
+
+
+def test_stores_sharing_a_backend_share_the_secret(store, tmp_path):
+    worker = AssetStore(store.backend, str(tmp_path / 'worker-assets'))
+    asset_id = store.put(png_bytes())['asset_id']
+    assert worker.verify(asset_id, *signed(store, asset_id))
+
+
+def test_mime_type_is_registered_or_sniffed(store):
+    content = png_bytes()
+    assert store.put(content, 'a.png', 'image/png')['mime_type'] == 'image/png'
+    assert store.put(png_bytes((1, 2, 3)), 'b.png', 'application/octet-stream')['mime_type'] == 'image/png'
+    # Non-standard types such as image/jpg never reach the Content-Type header
+    assert store.put(b'\xff\xd8\xff\xe0jpeg', 'c.jpg', 'image/jpg')['mime_type'] == 'image/jpeg'
+    assert store.put(b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'd.webp', None)['mime_type'] == 'image/webp'
+
+
+def test_content_needs_signature_or_admin_token(app_client):
+    meta = main.asset_store.put(png_bytes(), 'product.png', 'image/png')
+    path = f"/assets/{meta['asset_id']}/content"
+
+    assert app_client.get(path).status_code == 403
+    assert app_client.get(path, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    response = app_client.get(f"{path}?{main.asset_store.signed_query(meta['asset_id'])}")
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/png'
+
+    response = app_client.get(path, headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert response.status_code == 200
+    assert response.content == main.asset_store.read(meta['asset_id'])
+
+
+def test_shared_url_rejects_expired_signature(app_client):
+    asset_id = main.asset_store.put(png_bytes((9, 9, 9)))['asset_id']
+    expires = int(time.time()) - 1
+    signature = main.asset_store._signature(asset_id, expires)
+    assert app_client.get(f"/assets/{asset_id}/shared?expires={expires}&signature={signature}").status_code == 403
@@ -0,0 +1,37 @@
+"""Interrupted batches: which items wait for resumed jobs, and when the batch completes"""
+import pytest
+
+from utils.batch_store import BatchStore
+from utils.results import ResultRecord
+from utils.state_backend import SQLiteBackend
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BatchStore(SQLiteBackend(str(tmp_path / 'state.db')))
+
+
+def test_interrupted_batch_completes_once_resumed_jobs_finish(store):
+    store.create('batch_1', ['Product_1', 'Product_2', 'Product_3'])
+    store.set_result('batch_1', 0, ResultRecord('Product_1', 'success'))
+    store.mark_unfinished('batch_1', 'interrupted', resumable={1})
+    assert store.get_status('batch_1') == 'interrupted'
+    assert [record.status for record in store.get_records('batch_1')] == ['success', 'interrupted', 'failed']
+
+    store.set_result('batch_1', 1, ResultRecord('Product_2', 'success'))
+    assert store.complete_if_finished('batch_1')
+    assert store.get_status('batch_1') == 'completed'
+
+
+def test_interrupted_batch_without_jobs_completes_at_once(store):
+    store.create('batch_2', ['Product_1', 'Product_2'])
+    store.mark_unfinished('batch_2', 'interrupted', resumable=set())
+    assert store.get_status('batch_2') == 'completed'
+    assert all(record.status == 'failed' and record.error for record in store.get_records('batch_2'))
+
+
+def test_other_statuses_keep_unfinished_items(store):
+    store.create('batch_3', ['Product_1'])
+    store.mark_unfinished('batch_3', 'cancelled')
+    assert store.get_status('batch_3') == 'cancelled'
+    assert store.get_records('batch_3')[0].status == 'cancelled'
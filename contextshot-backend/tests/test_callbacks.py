@@ -0,0 +1,116 @@
+"""Callback mode: /callbacks/bria authentication, cross-worker delivery, timeouts and reconciliation"""
+import asyncio
+import threading
+import uuid
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import main
+from utils.callbacks import CallbackRegistry, CallbackTimeout
+
+
+class BriaStandIn:
+    """Client stand-in whose async submissions complete by POSTing to the callback URL, as Bria does"""
+
+    def __init__(self, http, deliver: bool = True, delay: float = 0.05):
+        self.http = http
+        self.deliver = deliver
+        self.delay = delay
+        self.submitted = []
+
+    def submit_replace_background(self, image_base64, prompt, seed=None, callback_url=None, draft=False):
+        request_id = f"req-{uuid.uuid4().hex[:12]}"
+        self.submitted.append(request_id)
+        if self.deliver:
+            payload = {'request_id': request_id, 'status': 'completed',
+                       'result': {'image_url': f"https://bria.test/{request_id}.png", 'seed': seed}}
+            threading.Timer(self.delay, self.http.post, args=(callback_url,), kwargs={'json': payload}).start()
+        return {'request_id': request_id, 'status_url': f"https://bria.test/status/{request_id}"}
+
+    def check_job_status(self, status_url):
+        return {'status': 'in_progress'}
+
+
+@pytest.fixture
+def bria(app_client, monkeypatch):
+    stand_in = BriaStandIn(app_client)
+    monkeypatch.setattr(main, 'contextshot_client', stand_in)
+    return stand_in
+
+
+def test_callback_rejects_missing_or_wrong_token(app_client):
+    payload = {'request_id': 'req-forged', 'result': {'image_url': 'https://evil.test/x.png'}}
+    assert app_client.post('/callbacks/bria', json=payload).status_code == 403
+    assert app_client.post('/callbacks/bria?token=wrong', json=payload).status_code == 403
+    assert main.state.get('callback:req-forged') is None
+
+
+def test_callback_url_token_is_accepted(app_client):
+    token = parse_qs(urlparse(main.callbacks.callback_url).query)['token'][0]
+    response = app_client.post(f"/callbacks/bria?token={token}", json={'request_id': 'req-ok', 'result': {'image_url': 'https://bria.test/ok.png'}})
+    assert response.status_code == 200
+    assert main.state.get('callback:req-ok')['image_url'] == 'https://bria.test/ok.png'
+
+
+def test_replace_background_waits_for_callback(app_client, bria):
+    result = app_client.portal.call(main.replace_background, 'interactive', 'aW1hZ2U=', 'a marble desk', 7)
+    request_id = bria.submitted[-1]
+    assert result['image_url'] == f"https://bria.test/{request_id}.png"
+    assert result['seed'] == 7
+    assert main.job_registry.get(request_id)['status'] == 'completed'
+
+
+def test_replace_background_timeout_fails_the_job(app_client, bria, monkeypatch):
+    bria.deliver = False
+    monkeypatch.setattr(main, 'CALLBACK_TIMEOUT', 0.1)
+    with pytest.raises(CallbackTimeout):
+        app_client.portal.call(main.replace_background, 'interactive', 'aW1hZ2U=', 'a marble desk', 7)
+    job = main.job_registry.get(bria.submitted[-1])
+    assert job['status'] == 'failed'
+    assert all(pending['request_id'] != bria.submitted[-1] for pending in main.job_registry.pending())
+
+
+def test_completion_on_another_worker_reaches_waiter(app_client):
+    # This registry plays a second worker sharing the app's backend; the callback lands on the app
+    worker = CallbackRegistry('http://worker-2', main.state, check_interval=0.02)
+    assert worker.secret == main.callbacks.secret
+
+    def never_polled(status_url):
+        raise AssertionError("an overdue-job poll was not expected")
+
+    async def wait_elsewhere():
+        reconciler = asyncio.create_task(worker.run_reconciler(never_polled))
+        try:
+            waiting = asyncio.create_task(worker.wait('req-cross', 'https://bria.test/status/req-cross', timeout=5))
+            await asyncio.sleep(0.05)
+            await asyncio.to_thread(app_client.post, main.callbacks.callback_url,
+                                    json={'request_id': 'req-cross', 'result': {'image_url': 'https://bria.test/cross.png'}})
+            return await waiting
+        finally:
+            reconciler.cancel()
+
+    result = app_client.portal.call(wait_elsewhere)
+    assert result['image_url'] == 'https://bria.test/cross.png'
+    assert worker.delivered == 1
+
+
+def test_reconciler_polls_overdue_job(app_client):
+    registry = CallbackRegistry('http://worker-3', main.state, reconcile_after=0.05, reconcile_interval=0.05, check_interval=0.02)
+    polled = []
+
+    def check_status(status_url):
+        polled.append(status_url)
+        return {'status': 'completed', 'image_url': 'https://bria.test/late.png'}
+
+    async def wait_without_callback():
+        reconciler = asyncio.create_task(registry.run_reconciler(check_status))
+        try:
+            return await registry.wait('req-lost', 'https://bria.test/status/req-lost', timeout=5)
+        finally:
+            reconciler.cancel()
+
+    result = asyncio.run(wait_without_callback())
+    assert result['image_url'] == 'https://bria.test/late.png'
+    assert polled == ['https://bria.test/status/req-lost']
+    assert registry.reconciled == 1
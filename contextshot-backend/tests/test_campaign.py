@@ -0,0 +1,16 @@
+"""/campaign/score request validation"""
+import pytest
+
+
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_top_k_must_be_positive(app_client, top_k):
+    response = app_client.post('/campaign/score', json={'grid': {'variation': ['Lifestyle', 'Commercial']}, 'top_k': top_k})
+    assert response.status_code == 422
+
+
+def test_top_k_limits_ranking(app_client):
+    grid = {'variation': ['Lifestyle', 'Commercial', 'Editorial']}
+    response = app_client.post('/campaign/score', json={'grid': grid, 'top_k': 2})
+    assert response.status_code == 200
+    assert response.json()['scored'] == 3
+    assert len(response.json()['results']) == 2
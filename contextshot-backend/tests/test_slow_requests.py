@@ -0,0 +1,47 @@
+"""Slow-request traces of streamed endpoints cover the body, not just the headers"""
+import io
+import time
+
+import pytest
+from PIL import Image
+
+import main
+from routers import admin
+
+
+class LifestyleStandIn:
+    """Client stand-in whose lifestyle shots take `delay` seconds each"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def generate_lifestyle_shot_by_text(self, product_image_url, prompt, num_results):
+        time.sleep(self.delay)
+        return ['https://bria.test/lifestyle.png']
+
+
+@pytest.fixture
+def slow_log(app_client, monkeypatch):
+    monkeypatch.setattr(main, 'contextshot_client', LifestyleStandIn(delay=0.3))
+    monkeypatch.setattr(admin.slow_requests, 'threshold', 0.2)
+    monkeypatch.setattr(admin.slow_requests, 'entries', type(admin.slow_requests.entries)(maxlen=10))
+    return admin.slow_requests
+
+
+def product_png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), (10, 120, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('stream', ['true', 'false'])
+def test_slow_lifestyle_request_is_recorded(app_client, slow_log, stream):
+    response = app_client.post(
+        '/generate/lifestyle',
+        files={'file': ('product.png', product_png(), 'image/png')},
+        data={'lifestyle_prompt': 'on a kitchen counter', 'num_results': '1', 'stream': stream}
+    )
+    assert response.status_code == 200
+    entries = slow_log.recent(path='/generate/lifestyle')
+    assert len(entries) == 1
+    assert entries[0]['duration_ms'] >= 300
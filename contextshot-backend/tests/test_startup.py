@@ -0,0 +1,12 @@
+"""Startup budget gate: fails when cold start regresses past STARTUP_BUDGET_MS"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import startup  # noqa: E402
+
+
+def test_startup_within_budget():
+    result = startup.measure(runs=int(os.getenv('STARTUP_RUNS', '3')))
+    assert not startup.budget_failures(result, startup.DEFAULT_BUDGET_MS), result
@@ -0,0 +1,95 @@
+"""RedisBackend against the in-process RESP stand-in: commands, expiry and reconnects"""
+import socket
+import time
+
+import pytest
+
+from utils.state_backend import RedisBackend, StateBackendError, create_state_backend
+
+
+@pytest.fixture
+def backend(resp_server):
+    return create_state_backend(f"redis://127.0.0.1:{resp_server.port}/0")
+
+
+def test_get_set_delete(backend):
+    assert backend.get('missing') is None
+    backend.set('job', {'status': 'queued', 'items': [1, 2]})
+    assert backend.get('job') == {'status': 'queued', 'items': [1, 2]}
+    backend.delete('job')
+    assert backend.get('job') is None
+
+
+def test_set_if_absent(backend):
+    assert backend.set_if_absent('secret', 'first')
+    assert not backend.set_if_absent('secret', 'second')
+    assert backend.get('secret') == 'first'
+
+
+def test_incr(backend):
+    assert backend.incr('spend', 0.25) == 0.25
+    assert backend.incr('spend', 1.5) == 1.75
+    assert backend.incr('calls') == 1
+
+
+def test_hash(backend):
+    backend.hset('jobs', 'a', {'state': 'pending'})
+    assert backend.hincr('counts', 'done', 2) == 2
+    assert backend.hincr('counts', 'done') == 3
+    assert backend.hgetall('jobs') == {'a': {'state': 'pending'}}
+    backend.hdel('jobs', 'a')
+    assert backend.hgetall('jobs') == {}
+
+
+def test_list(backend):
+    assert backend.rpush('items', {'n': 1}, {'n': 2}) == 2
+    assert backend.rpush('items', {'n': 3}) == 3
+    backend.lset('items', 1, {'n': 20})
+    assert backend.lrange('items') == [{'n': 1}, {'n': 20}, {'n': 3}]
+    assert backend.lrange('items', 1, 1) == [{'n': 20}]
+    with pytest.raises(StateBackendError):
+        backend.lset('items', 5, {'n': 0})
+
+
+def test_expiry(backend):
+    backend.set('short', 1, ttl=0.05)
+    backend.set('kept', 1)
+    backend.expire('kept', 0.05)
+    assert backend.set_if_absent('lease', 'a', ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get('short') is None
+    assert backend.get('kept') is None
+    assert backend.set_if_absent('lease', 'b')
+
+
+def test_reconnects_after_server_drops_connection(resp_server, backend):
+    backend.set('key', 'value')
+    resp_server.drop_connections()
+    # The closed connection is noticed before sending, so even INCRBYFLOAT goes through once
+    assert backend.incr('count') == 1
+    resp_server.drop_connections()
+    assert backend.get('key') == 'value'
+    assert resp_server.applied.count('INCRBYFLOAT') == 1
+
+
+def test_applied_command_is_not_replayed_after_timeout(resp_server):
+    backend = RedisBackend('127.0.0.1', resp_server.port, timeout=0.2)
+    backend.incr('spend', 1)
+    resp_server.delays['INCRBYFLOAT'] = 0.5
+    with pytest.raises(socket.timeout):
+        backend.incr('spend', 1)
+    resp_server.delays.clear()
+    assert resp_server.applied.count('INCRBYFLOAT') == 2
+    assert backend.get('spend') == 2
+
+
+def test_failed_auth_does_not_leave_connection(resp_server):
+    resp_server.password = 'right'
+    backend = RedisBackend('127.0.0.1', resp_server.port, password='wrong')
+    with pytest.raises(StateBackendError):
+        backend.get('key')
+    assert getattr(backend._local, 'sock', None) is None
+
+    backend.password = 'right'
+    backend.set('key', 'value')
+    assert backend.get('key') == 'value'
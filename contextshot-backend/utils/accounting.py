@@ -0,0 +1,202 @@
+import contextvars
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from utils.state_backend import StateBackend
+from utils.scheduler import current_tenant
+from utils.jobs import job_context
+
+logger = logging.getLogger(__name__)
+
+# Estimated dollar cost of each metered upstream operation
+DEFAULT_UNIT_COSTS = {
+    'bria_call': 0.50,
+    'bria_poll': 0.0,
+    'bria_retry': 0.0,
+    'claude_prompt': 0.01
+}
+
+# Upstream client methods that are not metered as one 'bria_call' when the scheduler runs them
+UPSTREAM_KINDS = {
+    '_generate_perfect_prompt_with_claude': 'claude_prompt',
+    # Status polling is metered per request by the client ('bria_poll', 'bria_retry')
+    'poll_job_status': None,
+    'check_job_status': None
+}
+
+# Usage accumulated by the request currently being served (see UsageMeter.begin_scope)
+usage_scope: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar('usage_scope', default=None)
+
+
+def usage_kind(func) -> Optional[str]:
+    """Metered operation an upstream call counts as, or None if it is not metered as a whole"""
+    return UPSTREAM_KINDS.get(getattr(func, '__name__', ''), 'bria_call')
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call would spend budget that is exhausted or reserved for interactive work"""
+
+    def __init__(self, message: str, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class UsageMeter:
+    """Meters upstream calls per day, month, tenant and batch, and enforces spending budgets
+
+    Bulk (batch) work may only spend up to (1 - bulk_reserve) of each budget and is slowed
+    down progressively once it passes the slowdown threshold, so catalog runs can never
+    consume the share that interactive users depend on.
+
+    Budgets are hard limits across workers: check() turns calls away before they queue, and
+    record_call() charges each call with an atomic increment as it is dispatched, rolling the
+    charge back if calls that passed check() together would overshoot.
+    """
+
+    def __init__(self, backend: StateBackend, unit_costs: Optional[Dict[str, float]] = None,
+                 daily_budget: float = 0, monthly_budget: float = 0,
+                 bulk_reserve: float = 0.2, bulk_slowdown: float = 0.6, max_delay: float = 10.0):
+        self.backend = backend
+        self.unit_costs = {**DEFAULT_UNIT_COSTS, **(unit_costs or {})}
+        self.daily_budget = daily_budget
+        self.monthly_budget = monthly_budget
+        self.bulk_reserve = bulk_reserve
+        self.bulk_slowdown = bulk_slowdown
+        self.max_delay = max_delay
+
+    @staticmethod
+    def _periods(now: Optional[datetime] = None):
+        now = now or datetime.now()
+        return now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+
+    def begin_scope(self) -> Dict[str, float]:
+        """Start collecting usage for the current request; returns the live totals"""
+        scope = {'cost': 0.0}
+        usage_scope.set(scope)
+        return scope
+
+    def _charge(self, day: str, month: str, cost: float, priority: Optional[str]):
+        """Add cost to the day and month totals; with a priority, undo it and raise QuotaExceeded
+        if the new totals pass what that priority class may spend"""
+        charged = []
+        try:
+            for period, label, budget, key in (('day', 'Daily', self.daily_budget, f"usage:day:{day}"),
+                                               ('month', 'Monthly', self.monthly_budget, f"usage:month:{month}")):
+                total = self.backend.hincr(key, 'cost', cost)
+                charged.append(key)
+                if priority is None or not budget or cost <= 0:
+                    continue
+                limit = budget if priority != 'batch' else budget * (1 - self.bulk_reserve)
+                if total > limit + 1e-9:
+                    raise self._exceeded(priority, period, label, budget, total - cost)
+        except QuotaExceeded:
+            for key in charged:
+                self.backend.hincr(key, 'cost', -cost)
+            raise
+
+    def record(self, kind: str, count: int = 1, priority: Optional[str] = None):
+        """Meter one or more upstream operations against every accounting dimension
+
+        With a priority, the budgets are enforced: nothing is recorded and QuotaExceeded is
+        raised if the cost would take spending past what that priority class may use.
+        """
+        cost = self.unit_costs.get(kind, 0.0) * count
+        day, month = self._periods()
+        tenant = current_tenant.get()
+        context = job_context.get() or {}
+
+        self._charge(day, month, cost, priority)
+        for key in (f"usage:day:{day}", f"usage:month:{month}", f"usage:tenant:{tenant}:{month}"):
+            self.backend.hincr(key, kind, count)
+        self.backend.hincr(f"usage:tenant:{tenant}:{month}", 'cost', cost)
+        self.backend.hincr(f"usage:month:{month}:tenant_cost", tenant, cost)
+        if context.get('batch_id'):
+            self.backend.hincr(f"usage:batch:{context['batch_id']}", kind, count)
+            self.backend.hincr(f"usage:batch:{context['batch_id']}", 'cost', cost)
+
+        scope = usage_scope.get()
+        if scope is not None:
+            scope[kind] = scope.get(kind, 0) + count
+            scope['cost'] += cost
+
+    def record_call(self, priority: str, func):
+        """Scheduler meter hook: charge one upstream call of `func`, or raise QuotaExceeded"""
+        kind = usage_kind(func)
+        if kind:
+            self.record(kind, priority=priority)
+
+    def spent(self) -> Dict[str, float]:
+        day, month = self._periods()
+        return {
+            'day': self.backend.hgetall(f"usage:day:{day}").get('cost', 0.0),
+            'month': self.backend.hgetall(f"usage:month:{month}").get('cost', 0.0)
+        }
+
+    @staticmethod
+    def _seconds_until_reset(period: str) -> int:
+        now = datetime.now()
+        if period == 'day':
+            reset = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        else:
+            reset = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+        return max(1, math.ceil((reset - now).total_seconds()))
+
+    def check(self, priority: str, kind: Optional[str] = 'bria_call') -> float:
+        """Return seconds to delay a call of this priority class, or raise QuotaExceeded
+
+        The cost of the call being admitted is counted up front. Calls checked at the same
+        time can all pass, so record_call() enforces the budgets again when it charges them.
+        """
+        spent = self.spent()
+        next_cost = self.unit_costs.get(kind, 0.0)
+        delay = 0.0
+        for period, label, budget in (('day', 'Daily', self.daily_budget), ('month', 'Monthly', self.monthly_budget)):
+            if not budget:
+                continue
+            used = (spent[period] + next_cost) / budget
+            if priority != 'batch':
+                if used > 1:
+                    raise self._exceeded(priority, period, label, budget, spent[period])
+                continue
+
+            ceiling = 1 - self.bulk_reserve
+            if used > ceiling:
+                raise self._exceeded(priority, period, label, budget, spent[period])
+            slowdown_start = self.bulk_slowdown * ceiling
+            if used >= slowdown_start:
+                delay = max(delay, self.max_delay * (used - slowdown_start) / (ceiling - slowdown_start))
+        return delay
+
+    def _exceeded(self, priority: str, period: str, label: str, budget: float, spent: float) -> QuotaExceeded:
+        if priority != 'batch':
+            return QuotaExceeded(f"{label} budget of ${budget:.2f} exhausted", self._seconds_until_reset(period))
+        return QuotaExceeded(
+            f"Bulk work paused: {label.lower()} budget is {spent / budget:.0%} used, remainder reserved for interactive requests",
+            self._seconds_until_reset(period)
+        )
+
+    def check_call(self, priority: str, func) -> float:
+        """Scheduler budget-gate hook: check() for one upstream call of `func`"""
+        return self.check(priority, usage_kind(func))
+
+    def report(self, batch_id: Optional[str] = None) -> Dict:
+        day, month = self._periods()
+        spent = self.spent()
+        report = {
+            'unit_costs': self.unit_costs,
+            'today': {'date': day, **self.backend.hgetall(f"usage:day:{day}")},
+            'month': {'month': month, **self.backend.hgetall(f"usage:month:{month}")},
+            'budgets': {
+                'daily': self.daily_budget or None,
+                'monthly': self.monthly_budget or None,
+                'daily_remaining': round(self.daily_budget - spent['day'], 2) if self.daily_budget else None,
+                'monthly_remaining': round(self.monthly_budget - spent['month'], 2) if self.monthly_budget else None,
+                'bulk_reserve': self.bulk_reserve
+            },
+            'tenants': self.backend.hgetall(f"usage:month:{month}:tenant_cost")
+        }
+        if batch_id:
+            report['batch'] = {'batch_id': batch_id, **self.backend.hgetall(f"usage:batch:{batch_id}")}
+        return report
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a pool is saturated and its wait queue is full"""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+        super().__init__(f"{pool_name} capacity exhausted, retry after {retry_after}s")
+
+
+class AdmissionSlot:
+    """One held in-flight slot; release() is idempotent so every exit path can call it"""
+
+    def __init__(self, pool: 'AdmissionPool'):
+        self.pool = pool
+        self.started = time.monotonic()
+
+    def release(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            pool._finish(time.monotonic() - self.started)
+
+
+class AdmissionPool:
+    """Bounded in-flight budget with a bounded FIFO wait queue"""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, initial_service_time: float = 5.0):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self.waiters = deque()
+        # Exponentially weighted average of how long an admitted request holds its slot
+        self.avg_service_time = initial_service_time
+        self.admitted = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        """Estimate seconds until a queue position frees up"""
+        ahead = len(self.waiters) + 1
+        wait = ahead * self.avg_service_time / self.max_in_flight
+        return max(1, math.ceil(wait))
+
+    def _release(self):
+        # Hand the slot directly to the next live waiter so queued requests keep FIFO order
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _finish(self, elapsed: float):
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+        self._release()
+
+    async def acquire(self) -> AdmissionSlot:
+        """Take one in-flight slot, queueing if needed; the caller must release() it"""
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self.in_flight += 1
+        elif len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Slot was handed over just as we were cancelled; pass it on
+                    self._release()
+                else:
+                    try:
+                        self.waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+        self.admitted += 1
+        return AdmissionSlot(self)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold one in-flight slot for the duration of the block"""
+        slot = await self.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def snapshot(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'queued': len(self.waiters),
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'avg_service_time': round(self.avg_service_time, 3),
+            'admitted': self.admitted,
+            'rejected': self.rejected
+        }
+
+
+class AdmissionController:
+    """Routes requests to named admission pools"""
+
+    def __init__(self):
+        self.pools: Dict[str, AdmissionPool] = {}
+        self.routes: Dict[str, str] = {}
+        # Routes whose response body outlives the handler; they hold their slot until the stream ends
+        self.streamed: Set[str] = set()
+        # Set on shutdown: every routed request is turned away while in-flight work finishes
+        self.draining = False
+
+    def add_pool(self, name: str, max_in_flight: int, max_queue: int, paths=(), streamed=()):
+        self.pools[name] = AdmissionPool(name, max_in_flight, max_queue)
+        for path in paths:
+            self.routes[path] = name
+        self.streamed.update(streamed)
+        logger.info(f"🚦 Admission pool '{name}': {max_in_flight} in flight, queue {max_queue}, routes {list(paths)}")
+
+    def pool_for(self, path: str) -> Optional[AdmissionPool]:
+        name = self.routes.get(path)
+        return self.pools.get(name) if name else None
+
+    def snapshot(self) -> Dict:
+        return {name: pool.snapshot() for name, pool in self.pools.items()}
@@ -0,0 +1,61 @@
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+# Client instance of a pool process, created once by init_worker
+_client = None
+
+
+def init_worker(api_token: str):
+    """Process pool initializer: import the client once per worker process, not once per image"""
+    global _client
+    from utils.contextshot_client import ContextShotClient
+    _client = ContextShotClient(api_token)
+
+
+class SpooledUpload:
+    """The parts of UploadFile that visual analysis reads, backed by a spooled file on disk"""
+
+    def __init__(self, path: str, filename: str, content_type: Optional[str]):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = os.path.getsize(path)
+        self.file = open(path, 'rb')
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset: int):
+        return self.file.seek(offset)
+
+    def close(self):
+        self.file.close()
+
+
+def spool(uploads: List, directory: str) -> List[str]:
+    """Copy uploads to files in `directory`, so pool processes get a path instead of pickled bytes"""
+    paths = []
+    for index, upload in enumerate(uploads):
+        path = os.path.join(directory, f"{index:05d}")
+        upload.file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(upload.file, f, 1024 * 1024)
+        paths.append(path)
+    return paths
+
+
+def analyze_file(path: str, filename: str, content_type: Optional[str]) -> Dict:
+    """Runs in a pool process: visual analysis of one spooled upload"""
+    started = time.perf_counter()
+    upload = SpooledUpload(path, filename, content_type)
+    try:
+        visual_context = _client._analyze_visual_content(upload, filename)
+    finally:
+        upload.close()
+    return {
+        'visual_context': visual_context,
+        'file_size': upload.size,
+        'seconds': round(time.perf_counter() - started, 3),
+        'worker_pid': os.getpid()
+    }
@@ -0,0 +1,173 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from utils.profiling import trace_stage
+from utils.state_backend import StateBackend
+
+
+# Served as Content-Type, so only registered MIME types; anything else is sniffed from the bytes
+IMAGE_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+
+def sniff_mime(content: bytes) -> str:
+    if content.startswith(b'\x89PNG'):
+        return 'image/png'
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class AssetNotFound(Exception):
+    """Raised when an asset id is unknown or its file has expired"""
+
+
+class AssetStore:
+    """Uploaded product images registered once under a stable, content-derived id
+
+    Bytes live on disk under `root` (shared by every worker on the host); metadata lives in
+    the shared-state backend. With share_bytes, the bytes are also kept in the shared-state
+    backend, so an asset registered on one host can be served from any other (each host
+    materializes its own disk copy on first use). Base64 encodings are cached in memory so repeat lifestyle and
+    reference calls for the same asset skip both the upload and the re-encode.
+
+    Reading an asset's bytes over HTTP needs a signed, expiring URL. With a public_url, those
+    URLs are also handed to upstream services, which fetch the image once instead of
+    receiving it inline in every request.
+    """
+
+    def __init__(self, backend: StateBackend, root: str, ttl_seconds: float = 24 * 3600, cache_size: int = 32,
+                 public_url: Optional[str] = None, url_secret: Optional[str] = None, share_bytes: bool = False):
+        self.backend = backend
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.share_bytes = share_bytes
+        self.cache_size = cache_size
+        self._encoded: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.public_url = public_url.rstrip('/') if public_url else None
+        if url_secret is None:
+            # Any worker may serve a URL signed by another, so the secret is shared; workers
+            # starting together race to store one, and all of them use the stored value
+            backend.set_if_absent('assets:url_secret', secrets.token_urlsafe(32))
+            url_secret = backend.get('assets:url_secret')
+        self._url_secret = url_secret.encode('utf-8')
+
+    @staticmethod
+    def _meta_key(asset_id: str) -> str:
+        return f"asset:{asset_id}"
+
+    @staticmethod
+    def _content_key(asset_id: str) -> str:
+        return f"asset:{asset_id}:content"
+
+    def _path(self, asset_id: str) -> str:
+        return os.path.join(self.root, asset_id)
+
+    def _write_file(self, asset_id: str, content: bytes):
+        # Write then rename, so a concurrent reader never sees a partial file
+        tmp_path = f"{self._path(asset_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, self._path(asset_id))
+
+    def _local_copy(self, asset_id: str) -> bool:
+        """Make sure this host has the asset's bytes on disk, fetching them from shared state if needed"""
+        if os.path.exists(self._path(asset_id)):
+            return True
+        if not self.share_bytes:
+            return False
+        encoded = self.backend.get(self._content_key(asset_id))
+        if encoded is None:
+            return False
+        self._write_file(asset_id, base64.b64decode(encoded))
+        return True
+
+    def put(self, content: bytes, filename: str = '', content_type: Optional[str] = None) -> Dict:
+        """Register image bytes; uploading identical bytes again returns the same asset"""
+        asset_id = 'asset_' + hashlib.sha256(content).hexdigest()[:24]
+        meta = self.backend.get(self._meta_key(asset_id))
+        if meta is None or not os.path.exists(self._path(asset_id)):
+            meta = {
+                'asset_id': asset_id,
+                'filename': filename,
+                'mime_type': content_type if content_type in IMAGE_MIME_TYPES else sniff_mime(content),
+                'size': len(content),
+                'created_at': datetime.now().isoformat()
+            }
+            self._write_file(asset_id, content)
+        # Every registration refreshes the expiry
+        if self.share_bytes:
+            self.backend.set(self._content_key(asset_id), base64.b64encode(content).decode('ascii'), ttl=self.ttl_seconds)
+        self.backend.set(self._meta_key(asset_id), meta, ttl=self.ttl_seconds)
+        return meta
+
+    def get(self, asset_id: str) -> Dict:
+        meta = self.backend.get(self._meta_key(asset_id))
+        if meta is None or not self._local_copy(asset_id):
+            raise AssetNotFound(f"Asset {asset_id} not found")
+        return meta
+
+    def path(self, asset_id: str) -> str:
+        self.get(asset_id)
+        return self._path(asset_id)
+
+    def read(self, asset_id: str) -> bytes:
+        self.get(asset_id)
+        with open(self._path(asset_id), 'rb') as f:
+            return f.read()
+
+    def base64(self, asset_id: str) -> str:
+        """Base64 encoding of the asset, encoded at most once while it stays cached"""
+        with self._lock:
+            if asset_id in self._encoded:
+                self._encoded.move_to_end(asset_id)
+                return self._encoded[asset_id]
+        with trace_stage('base64'):
+            encoded = base64.b64encode(self.read(asset_id)).decode('utf-8')
+        with self._lock:
+            self._encoded[asset_id] = encoded
+            while len(self._encoded) > self.cache_size:
+                self._encoded.popitem(last=False)
+        return encoded
+
+    def data_url(self, asset_id: str) -> str:
+        return f"data:{self.get(asset_id)['mime_type']};base64,{self.base64(asset_id)}"
+
+    def _signature(self, asset_id: str, expires: int) -> str:
+        return hmac.new(self._url_secret, f"{asset_id}:{expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def signed_query(self, asset_id: str, ttl_seconds: float = 900) -> str:
+        """expires/signature query granting read access to the asset; the expiry is rounded up to
+        the minute so repeated calls in the same minute yield the same URL"""
+        expires = (int(time.time() + ttl_seconds) // 60 + 1) * 60
+        return f"expires={expires}&signature={self._signature(asset_id, expires)}"
+
+    def signed_url(self, asset_id: str, ttl_seconds: float = 900) -> str:
+        """Expiring URL for the asset under public_url, for upstream services to fetch"""
+        self.get(asset_id)
+        return f"{self.public_url}/assets/{asset_id}/shared?{self.signed_query(asset_id, ttl_seconds)}"
+
+    def verify(self, asset_id: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(signature, self._signature(asset_id, expires))
+
+    def cleanup(self) -> int:
+        """Delete files whose metadata has expired; returns the number removed"""
+        removed = 0
+        for name in os.listdir(self.root):
+            if name.startswith('asset_') and not name.endswith('.tmp') and self.backend.get(self._meta_key(name)) is None:
+                os.remove(self._path(name))
+                with self._lock:
+                    self._encoded.pop(name, None)
+                removed += 1
+        return removed
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from utils.state_backend import StateBackend
+from utils.results import ResultRecord
+
+
+def item_fingerprint(image_hash: str, config: Dict[str, Any], pipeline: str) -> str:
+    """Identity of one item's output: the same image, effective config and pipeline give the same result"""
+    canonical = json.dumps([image_hash, config, pipeline], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class BatchStore:
+    """Batch job status and per-item results kept in the shared-state backend
+
+    Items are stored as positional rows (see ResultRecord.to_row) rather than keyed dicts,
+    so large batches do not repeat field names, status strings or default product names.
+    """
+
+    def __init__(self, backend: StateBackend, ttl_seconds: float = 7 * 24 * 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _meta_key(batch_id: str) -> str:
+        return f"batch:{batch_id}:meta"
+
+    @staticmethod
+    def _results_key(batch_id: str) -> str:
+        return f"batch:{batch_id}:results"
+
+    @staticmethod
+    def _fingerprints_key(batch_id: str) -> str:
+        return f"batch:{batch_id}:fingerprints"
+
+    @staticmethod
+    def _version_key(batch_id: str) -> str:
+        return f"batch:{batch_id}:version"
+
+    def _touch(self, batch_id: str):
+        """Bump the batch version; pollers use it as an ETag to skip unchanged responses"""
+        self.backend.incr(self._version_key(batch_id))
+        self.backend.expire(self._version_key(batch_id), self.ttl_seconds)
+
+    def get_version(self, batch_id: str) -> int:
+        return int(self.backend.get(self._version_key(batch_id)) or 0)
+
+    def create(self, batch_id: str, product_names: List[str]):
+        """Register a batch with one pending placeholder per item, so each item keeps a stable index"""
+        self.backend.delete(self._results_key(batch_id), self._fingerprints_key(batch_id))
+        if product_names:
+            self.backend.rpush(self._results_key(batch_id), *[
+                ResultRecord(name, 'pending').to_row(index) for index, name in enumerate(product_names)
+            ])
+            self.backend.expire(self._results_key(batch_id), self.ttl_seconds)
+        self.backend.set(self._meta_key(batch_id), {
+            'status': 'processing',
+            'total': len(product_names),
+            'created_at': datetime.now().isoformat()
+        }, ttl=self.ttl_seconds)
+        self._touch(batch_id)
+
+    def set_status(self, batch_id: str, status: str):
+        meta = self.backend.get(self._meta_key(batch_id)) or {}
+        meta['status'] = status
+        meta['updated_at'] = datetime.now().isoformat()
+        self.backend.set(self._meta_key(batch_id), meta, ttl=self.ttl_seconds)
+        self._touch(batch_id)
+
+    def get_status(self, batch_id: str) -> Optional[str]:
+        meta = self.backend.get(self._meta_key(batch_id))
+        return meta['status'] if meta else None
+
+    def set_result(self, batch_id: str, index: int, result: Union[ResultRecord, Dict], fingerprint: Optional[str] = None,
+                   generated_at: Optional[float] = None):
+        """Store an item's result; successful results with a fingerprint can be carried into re-runs
+
+        generated_at is when the result's URLs were produced (now, unless it was carried forward),
+        so a chain of re-runs cannot keep handing on URLs that have since expired.
+        """
+        if isinstance(result, dict):
+            result = ResultRecord.from_dict(result)
+        self.backend.lset(self._results_key(batch_id), index, result.to_row(index))
+        if fingerprint and result.status == 'success':
+            self.backend.hset(self._fingerprints_key(batch_id), fingerprint, [index, generated_at or time.time()])
+            self.backend.expire(self._fingerprints_key(batch_id), self.ttl_seconds)
+        self._touch(batch_id)
+
+    def get_fingerprinted(self, batch_id: str, max_age: Optional[float] = None) -> Dict[str, Tuple[ResultRecord, float]]:
+        """Successful items of a batch keyed by fingerprint, with when they were generated
+
+        Items generated more than max_age seconds ago are left out, since their upstream URLs
+        may be signed and already expired.
+        """
+        entries = self.backend.hgetall(self._fingerprints_key(batch_id))
+        if not entries:
+            return {}
+        records = self.get_records(batch_id)
+        cutoff = time.time() - max_age if max_age else 0
+        fingerprinted = {}
+        for fp, (index, generated_at) in entries.items():
+            if index < len(records) and records[index].status == 'success' and generated_at >= cutoff:
+                fingerprinted[fp] = (records[index], generated_at)
+        return fingerprinted
+
+    def mark_unfinished(self, batch_id: str, status: str = 'interrupted', resumable: Optional[Set[int]] = None):
+        """Flag items that never produced a result, e.g. when a batch is cut short by shutdown
+
+        With `resumable`, only those items (the ones with a persisted Bria job the next process
+        will resume) keep the status. The rest can never be filled, so they fail now, and the
+        batch completes as soon as the resumable items are filled (at once if there are none).
+        """
+        for index, record in enumerate(self.get_records(batch_id)):
+            if record.status != 'pending':
+                continue
+            if resumable is None or index in resumable:
+                record.status = status
+            else:
+                record.status = 'failed'
+                record.error = f"Batch {status} before this item was submitted"
+            self.set_result(batch_id, index, record)
+        self.set_status(batch_id, status)
+        if resumable is not None:
+            self.complete_if_finished(batch_id)
+
+    def complete_if_finished(self, batch_id: str) -> bool:
+        """Mark an interrupted batch completed once resumed jobs have filled every unfinished item"""
+        if self.get_status(batch_id) != 'interrupted':
+            return False
+        if any(record.status in ('pending', 'interrupted') for record in self.get_records(batch_id)):
+            return False
+        self.set_status(batch_id, 'completed')
+        return True
+
+    def get_records(self, batch_id: str) -> List[ResultRecord]:
+        return [ResultRecord.from_row(row, index) for index, row in enumerate(self.backend.lrange(self._results_key(batch_id)))]
+
+    def get_results(self, batch_id: str) -> List[Dict]:
+        return [record.to_dict() for record in self.get_records(batch_id)]
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackTimeout(Exception):
+    """Raised when neither a callback nor a reconciliation poll resolved a job in time"""
+
+
+class _Waiter:
+    __slots__ = ('future', 'status_url', 'registered_at', 'last_polled')
+
+    def __init__(self, status_url: str):
+        self.future = Future()
+        self.status_url = status_url
+        self.registered_at = time.monotonic()
+        self.last_polled = self.registered_at
+
+
+class CallbackRegistry:
+    """Matches Bria completion callbacks to the requests waiting on them
+
+    Completions are also written to the shared-state backend, so a callback delivered to
+    one worker process resolves a waiter in another. A low-frequency reconciliation loop
+    polls status_url only for jobs whose callback is overdue, covering lost callbacks.
+    """
+
+    def __init__(self, public_url: str, backend: StateBackend, secret: Optional[str] = None,
+                 reconcile_after: float = 60.0, reconcile_interval: float = 30.0, check_interval: float = 1.0):
+        if secret is None:
+            # Every worker must accept callbacks addressed to any of them, so the secret is shared;
+            # workers starting together race to store one, and all of them use the stored value
+            backend.set_if_absent('callbacks:secret', secrets.token_urlsafe(16))
+            secret = backend.get('callbacks:secret')
+        self.secret = secret
+        self.callback_url = f"{public_url.rstrip('/')}/callbacks/bria?token={self.secret}"
+        self.backend = backend
+        self.reconcile_after = reconcile_after
+        self.reconcile_interval = reconcile_interval
+        self.check_interval = check_interval
+        self._waiters: Dict[str, _Waiter] = {}
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.reconciled = 0
+        self.timeouts = 0
+
+    @staticmethod
+    def _result_key(request_id: str) -> str:
+        return f"callback:{request_id}"
+
+    def verify(self, token: Optional[str]) -> bool:
+        return token is not None and secrets.compare_digest(token, self.secret)
+
+    def deliver(self, request_id: str, result: Dict) -> bool:
+        """Record a job completion; returns True if a waiter in this process was resolved"""
+        self.backend.set(self._result_key(request_id), result, ttl=3600)
+        with self._lock:
+            waiter = self._waiters.pop(request_id, None)
+        if waiter is None:
+            return False
+        if not waiter.future.done():
+            waiter.future.set_result(result)
+        self.delivered += 1
+        return True
+
+    async def wait(self, request_id: str, status_url: str, timeout: float = 300) -> Dict:
+        """Wait for a job's completion without holding a thread or polling Bria"""
+        waiter = _Waiter(status_url)
+        with self._lock:
+            self._waiters[request_id] = waiter
+        # The callback may have landed (here or on another worker) before we started waiting
+        early = await asyncio.to_thread(self.backend.get, self._result_key(request_id))
+        if early is not None:
+            await asyncio.to_thread(self.deliver, request_id, early)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise CallbackTimeout(f"Timed out waiting for callback for request {request_id}")
+        finally:
+            with self._lock:
+                self._waiters.pop(request_id, None)
+
+    async def run_reconciler(self, check_status: Callable[[str], Dict]):
+        """Resolve waiters from shared state, and poll Bria for jobs whose callback is overdue"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time.monotonic()
+            with self._lock:
+                waiting = list(self._waiters.items())
+
+            for request_id, waiter in waiting:
+                shared = await asyncio.to_thread(self.backend.get, self._result_key(request_id))
+                if shared is not None:
+                    await asyncio.to_thread(self.deliver, request_id, shared)
+                    continue
+                if now - waiter.registered_at < self.reconcile_after or now - waiter.last_polled < self.reconcile_interval:
+                    continue
+
+                waiter.last_polled = now
+                try:
+                    status = await asyncio.to_thread(check_status, waiter.status_url)
+                except Exception as e:
+                    logger.warning(f"⚠️ Reconciliation poll failed for {request_id}: {str(e)}")
+                    continue
+                if status.get('status') in ('completed', 'failed'):
+                    logger.info(f"🧭 Reconciled job {request_id} without a callback")
+                    self.reconciled += 1
+                    await asyncio.to_thread(self.deliver, request_id, status)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waiting = len(self._waiters)
+        return {
+            'waiting': waiting,
+            'delivered': self.delivered,
+            'reconciled': self.reconciled,
+            'timeouts': self.timeouts
+        }
@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Strings longer than this (base64 images, data URLs) are fingerprinted by their hash
+_INLINE_LIMIT = 256
+
+# Signed asset URLs differ on every run; only the asset they point at identifies the request
+_SIGNED_QUERY = re.compile(r'\?expires=\d+&signature=[0-9a-f]+')
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request has no recorded counterpart"""
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, str) and 'signature=' in value:
+        value = _SIGNED_QUERY.sub('', value)
+    if isinstance(value, str) and len(value) > _INLINE_LIMIT:
+        return 'sha256:' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+    if isinstance(value, (bytes, bytearray)):
+        return 'sha256:' + hashlib.sha256(value).hexdigest()
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def fingerprint(kind: str, target: str, payload: Any = None) -> str:
+    """Stable identity of a request, independent of the size of embedded images"""
+    canonical = json.dumps([kind, target, _canonical(payload)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class _Request:
+    __slots__ = ('method',)
+
+    def __init__(self, method: str):
+        self.method = method
+
+
+class CassetteResponse:
+    """Recorded HTTP response exposing the parts of requests.Response the client reads"""
+
+    def __init__(self, method: str, status_code: int, text: str, headers: Dict[str, str], content: Optional[bytes] = None):
+        self.request = _Request(method)
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        self.content = content if content is not None else text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Cassette:
+    """Records upstream Bria/Claude traffic to a gzip'd JSON-lines archive and replays it
+
+    Each entry stores the request fingerprint, the response (or return value) and the
+    original latency. Replay serves entries in recorded order per fingerprint and sleeps
+    for the original latency divided by `speed` (0 disables the delay entirely).
+    """
+
+    def __init__(self, path: str, mode: str = 'replay', speed: float = 1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._entries: Dict[str, deque] = defaultdict(deque)
+        self._last: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if mode == 'record':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = gzip.open(path, 'at', encoding='utf-8')
+        else:
+            self._file = None
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._entries[entry['fp']].append(entry)
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+                # A recorder that crashed leaves the archive without its trailer (and maybe a partial
+                # last line); every entry before that point was flushed and is still usable
+                logger.warning(f"⚠️ Cassette {path} is truncated ({str(e)}); replaying the entries before it")
+            logger.info(f"📼 Loaded {sum(len(q) for q in self._entries.values())} recorded interactions from {path}")
+
+    @classmethod
+    def from_env(cls) -> Optional['Cassette']:
+        """Build from CASSETTE_MODE / CASSETTE_PATH / CASSETTE_SPEED, or None when disabled"""
+        mode = os.getenv('CASSETTE_MODE')
+        if not mode:
+            return None
+        path = os.getenv('CASSETTE_PATH', os.path.join('cassettes', 'contextshot.jsonl.gz'))
+        logger.info(f"📼 Cassette {mode} mode: {path}")
+        return cls(path, mode, float(os.getenv('CASSETTE_SPEED', '1')))
+
+    def _write(self, entry: Dict):
+        with self._lock:
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            # Sync-flush every entry, so a crash loses at most the entry being written
+            self._file.flush()
+            self.recorded += 1
+
+    def _next(self, fp: str, description: str) -> Dict:
+        with self._lock:
+            queue = self._entries.get(fp)
+            if queue:
+                entry = queue.popleft()
+                self._last[fp] = entry
+            elif fp in self._last:
+                # Past the end of the recording (e.g. extra polls): keep serving the final answer
+                entry = self._last[fp]
+            else:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded interaction for {description}")
+            self.hits += 1
+        return entry
+
+    def _delay(self, entry: Dict) -> float:
+        return entry['elapsed'] / self.speed if self.speed else 0.0
+
+    def request(self, method: str, url: str, send: Callable, json_body: Any = None):
+        """Perform (record) or serve (replay) one HTTP request"""
+        fp = fingerprint(method, url, json_body)
+        if self.mode == 'replay':
+            entry = self._next(fp, f"{method} {url}")
+            time.sleep(self._delay(entry))
+            if 'body_b64' in entry:
+                content = base64.b64decode(entry['body_b64'])
+                return CassetteResponse(method, entry['status'], '', entry.get('headers', {}), content)
+            return CassetteResponse(method, entry['status'], entry['body'], entry.get('headers', {}))
+
+        start = time.monotonic()
+        response = send()
+        elapsed = time.monotonic() - start
+        content_type = response.headers.get('Content-Type', '')
+        entry = {
+            'fp': fp,
+            'kind': 'http',
+            'method': method,
+            'url': url,
+            'status': response.status_code,
+            'headers': {'Content-Type': content_type},
+            'elapsed': round(elapsed, 4),
+            't': round(start - self._started, 4)
+        }
+        # Downloaded images (cutouts, backgrounds) are binary; keep them byte-exact
+        if content_type.startswith('image/'):
+            entry['body_b64'] = base64.b64encode(response.content).decode('ascii')
+        else:
+            entry['body'] = response.text
+        self._write(entry)
+        return response
+
+    def wrap_call(self, name: str, func: Callable) -> Callable:
+        """Record or replay the JSON-serialisable return value of a (sync or async) function"""
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                fp = fingerprint('call', name, [args, kwargs])
+                if self.mode == 'replay':
+                    entry = self._next(fp, name)
+                    await asyncio.sleep(self._delay(entry))
+                    return entry['result']
+                start = time.monotonic()
+                result = await func(*args, **kwargs)
+                self._write({'fp': fp, 'kind': 'call', 'name': name, 'result': result,
+                             'elapsed': round(time.monotonic() - start, 4), 't': round(start - self._started, 4)})
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            fp = fingerprint('call', name, [args, kwargs])
+            if self.mode == 'replay':
+                entry = self._next(fp, name)
+                time.sleep(self._delay(entry))
+                return entry['result']
+            start = time.monotonic()
+            result = func(*args, **kwargs)
+            self._write({'fp': fp, 'kind': 'call', 'name': name, 'result': result,
+                         'elapsed': round(time.monotonic() - start, 4), 't': round(start - self._started, 4)})
+            return result
+        return wrapper
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+
+    def snapshot(self) -> Dict:
+        return {'mode': self.mode, 'path': self.path, 'speed': self.speed,
+                'recorded': self.recorded, 'hits': self.hits, 'misses': self.misses}
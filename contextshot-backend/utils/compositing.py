@@ -0,0 +1,124 @@
+import io
+import threading
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+# Same defaults as the replace_background payload, so local composites match Bria's framing
+DEFAULT_SHOT_SIZE = (1200, 1200)
+DEFAULT_PADDING = 20
+PLACEMENT_TYPES = ('automatic', 'manual_padding', 'original')
+
+# With automatic placement the product stands on the bottom padding line, at most this tall
+AUTOMATIC_MAX_HEIGHT = 0.8
+
+
+def placement(product_size: Tuple[int, int], shot_size: Tuple[int, int], placement_type: str, padding: int) -> Tuple[int, int, int, int]:
+    """Scaled size and top-left position (width, height, x, y) of a trimmed cutout on the canvas
+
+    automatic      - fit inside the padded area, capped in height, centered and resting on the bottom padding
+    manual_padding - fit exactly inside the padded area, centered
+    original       - keep the cutout's size (shrunk only if it does not fit), centered
+    """
+    if placement_type not in PLACEMENT_TYPES:
+        raise ValueError(f"placement_type must be one of {', '.join(PLACEMENT_TYPES)}")
+    width, height = product_size
+    shot_width, shot_height = shot_size
+    box_width, box_height = max(1, shot_width - 2 * padding), max(1, shot_height - 2 * padding)
+
+    if placement_type == 'original':
+        scale = min(1.0, box_width / width, box_height / height)
+    elif placement_type == 'manual_padding':
+        scale = min(box_width / width, box_height / height)
+    else:
+        scale = min(box_width / width, box_height * AUTOMATIC_MAX_HEIGHT / height)
+
+    scaled_width, scaled_height = max(1, round(width * scale)), max(1, round(height * scale))
+    x = (shot_width - scaled_width) // 2
+    if placement_type == 'automatic':
+        y = shot_height - padding - scaled_height
+    else:
+        y = (shot_height - scaled_height) // 2
+    return scaled_width, scaled_height, x, y
+
+
+class Compositor:
+    """Local product-on-background compositing: vectorized alpha blend plus a synthesized contact shadow
+
+    Thread-safe; PIL resampling and the NumPy blend release the GIL, so composites run in parallel
+    in a thread pool. Fitted backgrounds are cached, so a library background shared by a whole
+    batch is decoded and resized once. PIL and NumPy are only imported on first use.
+    """
+
+    def __init__(self, shot_size: Tuple[int, int] = DEFAULT_SHOT_SIZE, shadow_opacity: float = 0.35, cache_size: int = 8):
+        self.shot_size = tuple(shot_size)
+        self.shadow_opacity = shadow_opacity
+        self.cache_size = cache_size
+        self._backgrounds: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _background(self, key: str, load: Callable[[], bytes]):
+        """Background decoded and cover-fitted to the shot size, as a float32 RGB array"""
+        import numpy as np
+        from PIL import Image, ImageOps
+        with self._lock:
+            if key in self._backgrounds:
+                self._backgrounds.move_to_end(key)
+                return self._backgrounds[key]
+        image = Image.open(io.BytesIO(load())).convert('RGB')
+        canvas = np.asarray(ImageOps.fit(image, self.shot_size, Image.LANCZOS), dtype=np.float32)
+        canvas.setflags(write=False)
+        with self._lock:
+            self._backgrounds[key] = canvas
+            while len(self._backgrounds) > self.cache_size:
+                self._backgrounds.popitem(last=False)
+        return canvas
+
+    def _shadow(self, alpha, width: int, height: int):
+        """Soft elliptical contact shadow from the cutout's silhouette, squashed onto the ground"""
+        import numpy as np
+        from PIL import Image, ImageFilter
+        shadow_height = max(2, height // 8)
+        silhouette = Image.fromarray((alpha * 255).astype(np.uint8)).resize((width, shadow_height), Image.BILINEAR)
+        blur = max(2, shadow_height // 3)
+        padded = Image.new('L', (width + 4 * blur, shadow_height + 4 * blur))
+        padded.paste(silhouette, (2 * blur, 2 * blur))
+        return np.asarray(padded.filter(ImageFilter.GaussianBlur(blur)), dtype=np.float32) / 255, blur
+
+    def composite(self, product: bytes, background_key: str, load_background: Callable[[], bytes],
+                  placement_type: str = 'automatic', padding: int = DEFAULT_PADDING, quality: int = 92) -> bytes:
+        """Place a transparent product cutout on a background; returns JPEG bytes"""
+        import numpy as np
+        from PIL import Image
+        canvas = self._background(background_key, load_background).copy()
+        shot_width, shot_height = self.shot_size
+
+        cutout = Image.open(io.BytesIO(product)).convert('RGBA')
+        # Trim transparent margins so padding is measured from the product's visible edges
+        bbox = cutout.getchannel('A').getbbox()
+        if bbox:
+            cutout = cutout.crop(bbox)
+        width, height, x, y = placement(cutout.size, self.shot_size, placement_type, padding)
+        layer = np.asarray(cutout.resize((width, height), Image.LANCZOS), dtype=np.float32) / 255
+        rgb, alpha = layer[..., :3] * 255, layer[..., 3:]
+
+        if self.shadow_opacity > 0:
+            shadow, blur = self._shadow(alpha[..., 0], width, height)
+            top = y + height - shadow.shape[0] // 2
+            left = x - 2 * blur
+            # Clip the shadow to the canvas, then darken the background under it
+            y0, y1 = max(0, top), min(shot_height, top + shadow.shape[0])
+            x0, x1 = max(0, left), min(shot_width, left + shadow.shape[1])
+            if y1 > y0 and x1 > x0:
+                patch = shadow[y0 - top:y1 - top, x0 - left:x1 - left, None]
+                canvas[y0:y1, x0:x1] *= 1 - self.shadow_opacity * patch
+
+        # Alpha blend over the placement region (clipped in case the cutout overhangs the canvas)
+        y0, y1 = max(0, y), min(shot_height, y + height)
+        x0, x1 = max(0, x), min(shot_width, x + width)
+        region = canvas[y0:y1, x0:x1]
+        a = alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+        canvas[y0:y1, x0:x1] = rgb[y0 - y:y1 - y, x0 - x:x1 - x] * a + region * (1 - a)
+
+        output = io.BytesIO()
+        Image.fromarray(np.clip(canvas, 0, 255).astype(np.uint8)).save(output, format='JPEG', quality=quality)
+        return output.getvalue()
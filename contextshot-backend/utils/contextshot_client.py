@@ -1 +1,329 @@
-fatal: path 'contextshot-backend/utils/contextshot_client.py' exists on disk, but not in 'b4556c3'
+import requests
+import base64
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Dict
+
+# Draft renders: small and without original-quality upscaling, for judging a prompt quickly
+DRAFT_SHOT_SIZE = [512, 512]
+
+class ContextShotClient:
+    def __init__(self, api_token: str):
+        self.api_token = api_token
+        self.base_url = "https://engine.prod.bria-api.com/v2"
+        # Optional StatsRecorder; replaces the old processing_stats dict, which lost updates
+        # when to_thread workers incremented it concurrently
+        self.stats = None
+        # Optional PendingJobRegistry; async Bria jobs are persisted there so they survive restarts
+        self.job_registry = None
+        # Optional UsageMeter; every upstream call is metered for cost and quota accounting
+        self.usage_meter = None
+        # Optional Cassette; records upstream traffic or replays it without touching the network
+        self.cassette = None
+        
+        # Validate API token
+        if not api_token:
+            raise ValueError("API token is required")
+        
+        logging.info(f"✅ ContextShotClient initialized with API token: {api_token[:8]}...")
+    
+    def _meter(self, kind: str):
+        """Record a status check or retry with the usage meter, if configured
+
+        Whole upstream calls are metered by the scheduler that runs them, not here.
+        """
+        if self.usage_meter:
+            self.usage_meter.record(kind)
+    
+    def _record(self, name: str, seconds: Optional[float] = None, ok: bool = True):
+        """Record one operation with the stats recorder, if configured"""
+        if self.stats:
+            self.stats.record(name, seconds, ok)
+    
+    def get_processing_stats(self) -> Dict:
+        """Windowed throughput, success rate and latency percentiles"""
+        return self.stats.snapshot() if self.stats else {}
+    
+    def reset_stats(self):
+        """Reset processing statistics"""
+        if self.stats:
+            self.stats.reset()
+    
+    def _http(self, method: str, url: str, **kwargs):
+        """Send an upstream HTTP request, through the cassette when one is attached"""
+        if self.cassette:
+            return self.cassette.request(method, url, lambda: requests.request(method, url, **kwargs), json_body=kwargs.get('json'))
+        return requests.request(method, url, **kwargs)
+    
+    def _log_request(self, method: str, url: str, headers: dict, json: dict = None):
+        """Log API request details"""
+        logging.info(f"API Request | {method} {url} | headers={headers} | payload={{'json': {json}}}")
+    
+    def _log_response(self, url: str, response):
+        """Log API response details"""
+        logging.info(f"API Response | {response.request.method} {url} | status={response.status_code} | body={response.text[:100]}...")
+    
+    def _convert_file_to_base64(self, image_file) -> str:
+        """Convert image file to base64 string"""
+        try:
+            # Handle different file object types
+            if hasattr(image_file, 'read'):
+                file_content = image_file.read()
+            else:
+                file_content = image_file
+            
+            base64_string = base64.b64encode(file_content).decode('utf-8')
+            logging.info(f"🔍 Debug: Image converted to base64, length: {len(base64_string)}")
+            return base64_string
+        except Exception as e:
+            logging.error(f"❌ Error converting file to base64: {str(e)}")
+            raise Exception(f"Error converting file to base64: {str(e)}")
+    
+    def remove_product_background(self, image_file) -> Optional[str]:
+        """Remove background from product image using Bria API v2"""
+        try:
+            start_time = datetime.now()
+            base64_string = self._convert_file_to_base64(image_file)
+            
+            headers = {'api_token': self.api_token, 'Content-Type': 'application/json'}
+            data = {'image': base64_string, 'sync': True}
+            url = f"{self.base_url}/image/edit/remove_background"
+            
+            logging.info(f"🛍️ Removing product background: {len(base64_string)/1024/1024:.1f}MB")
+            
+            self._log_request('POST', url, headers, json=data)
+            response = self._http('POST', url, json=data, headers=headers)
+            self._log_response(url, response)
+            
+            logging.info(f"🔍 Response status: {response.status_code}")
+            logging.info(f"🔍 Response headers: {dict(response.headers)}")
+            logging.info(f"🔍 Response text: {response.text}")
+            
+            if response.status_code == 200:
+                result = response.json()
+                image_url = result.get('result', {}).get('image_url')
+                if image_url:
+                    processing_time = (datetime.now() - start_time).total_seconds()
+                    self._record('bria:remove_background', processing_time)
+                    logging.info(f"✅ Product background removed successfully in {processing_time:.1f}s")
+                    return image_url
+                else:
+                    raise Exception("No image_url in response")
+            else:
+                logging.error(f"❌ API returned status {response.status_code}: {response.text}")
+                raise Exception(f"API returned status {response.status_code}: {response.text}")
+            
+        except Exception as e:
+            self._record('bria:remove_background', (datetime.now() - start_time).total_seconds(), ok=False)
+            logging.error(f"❌ Error removing product background: {str(e)}")
+            raise Exception(f"Error removing product background: {str(e)}")
+    
+    def check_job_status(self, status_url: str) -> Dict:
+        """Check an asynchronous Bria job once; status is 'completed', 'failed' or 'pending'"""
+        self._meter('bria_poll')
+        status_response = self._http('GET', status_url, headers={'api_token': self.api_token})
+        
+        if status_response.status_code != 200:
+            logging.error(f"❌ Status check failed: {status_response.status_code} - {status_response.text}")
+            raise Exception(f"Status check failed: {status_response.status_code}")
+        
+        status_result = status_response.json()
+        status = status_result.get('status')
+        
+        if status == 'completed' or status == 'COMPLETED':
+            image_url = status_result.get('result', {}).get('image_url')
+            if not image_url:
+                raise Exception("No image_url in completed response")
+            return {'status': 'completed', 'image_url': image_url, 'seed': status_result.get('result', {}).get('seed')}
+        elif status == 'failed':
+            return {'status': 'failed', 'error': status_result.get('error', 'Unknown error')}
+        elif status in ['pending', 'processing', 'IN_PROGRESS']:
+            return {'status': 'pending', 'raw_status': status}
+        else:
+            logging.error(f"❌ Unknown status: {status}, response: {status_result}")
+            raise Exception(f"Unknown status: {status}")
+    
+    def poll_job_status(self, status_url: str, max_attempts: int = 30, poll_interval: float = 3) -> str:
+        """Poll an asynchronous Bria job until it completes and return its image URL"""
+        for attempt in range(max_attempts):
+            try:
+                job_status = self.check_job_status(status_url)
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"⚠️ Network error during status check: {e}, retrying...")
+                self._meter('bria_retry')
+                time.sleep(poll_interval)
+                continue
+            
+            if job_status['status'] == 'completed':
+                return job_status['image_url']
+            elif job_status['status'] == 'failed':
+                raise Exception(f"Background replacement failed: {job_status['error']}")
+            
+            logging.info(f"⏳ Status: {job_status['raw_status']}, waiting... (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(poll_interval)
+        
+        raise Exception("Timeout waiting for background replacement to complete")
+    
+    def _replace_background_payload(self, image_base64: str, background_prompt: str, seed: Optional[int] = None, draft: bool = False) -> Dict:
+        """Request body for replace_background with enhanced parameters for maximum quality"""
+        # Enhanced parameters for maximum quality based on Bria AI documentation
+        data = {
+            'image': image_base64,  # Inline base64, or a (signed) URL Bria fetches the image from
+            'prompt': background_prompt,
+            'force_rmbg': False,  # Don't force background removal - use original image
+            'placement_type': 'automatic',  # Let AI automatically place the product optimally
+            'shot_size': [1200, 1200],  # High resolution output (1200x1200)
+            'sync': True,  # Synchronous processing for immediate results
+            'preserve_alpha': True,  # Preserve alpha channel if present
+            'original_quality': True,  # Retain original resolution for maximum quality
+            'visual_input_content_moderation': True,  # Content moderation on input
+            'visual_output_content_moderation': True,  # Content moderation on output
+            'mask_type': 'automatic',  # Use automatic mask generation for better product detection
+            'padding': 20  # Add padding around the product for better composition
+        }
+        if draft:
+            # Same prompt and seed at a fraction of the render time; promote to full quality later
+            data['shot_size'] = DRAFT_SHOT_SIZE
+            data['original_quality'] = False
+        if seed is not None:
+            data['seed'] = seed
+        return data
+    
+    def submit_replace_background(self, image_base64: str, background_prompt: str, seed: Optional[int] = None, callback_url: Optional[str] = None, draft: bool = False) -> Dict:
+        """Submit replace_background asynchronously; Bria reports completion to callback_url
+
+        Returns {'image_url': ..., 'seed': ...} if Bria answered immediately, else {'request_id': ..., 'status_url': ...}.
+        """
+        headers = {'api_token': self.api_token, 'Content-Type': 'application/json'}
+        data = self._replace_background_payload(image_base64, background_prompt, seed, draft)
+        data['sync'] = False
+        if callback_url:
+            data['callback_url'] = callback_url
+        url = f"{self.base_url}/image/edit/replace_background"
+        
+        logging.info(f"📮 Submitting async background replacement: '{background_prompt[:100]}...'")
+        self._log_request('POST', url, headers, json=data)
+        response = self._http('POST', url, json=data, headers=headers)
+        self._log_response(url, response)
+        
+        if response.status_code == 200:
+            result = response.json().get('result', {})
+            if not result.get('image_url'):
+                raise Exception("No image_url in response")
+            return {'image_url': result['image_url'], 'seed': result.get('seed')}
+        elif response.status_code == 202:
+            result = response.json()
+            if not result.get('request_id') or not result.get('status_url'):
+                raise Exception("Missing request_id or status_url in response")
+            return {'request_id': result['request_id'], 'status_url': result['status_url']}
+        
+        raise Exception(f"API returned status {response.status_code}: {response.text}")
+    
+    def replace_product_background_enhanced(self, image_base64: str, background_prompt: str, seed: Optional[int] = None, draft: bool = False) -> Optional[Dict]:
+        """Replace product background using Bria AI v2 replace_background endpoint with enhanced parameters for maximum quality
+
+        Returns {'image_url': ..., 'seed': ...}; the seed is Bria's when it reports one, else the requested seed.
+        """
+        try:
+            start_time = datetime.now()
+            
+            headers = {'api_token': self.api_token, 'Content-Type': 'application/json'}
+            data = self._replace_background_payload(image_base64, background_prompt, seed, draft)
+            
+            url = f"{self.base_url}/image/edit/replace_background"
+            
+            logging.info(f"🎭 Replacing product background with enhanced parameters")
+            logging.info(f"🎭 Prompt: '{background_prompt[:100]}...'")
+            self._log_request('POST', url, headers, json=data)
+            
+            response = self._http('POST', url, json=data, headers=headers)
+            self._log_response(url, response)
+            
+            if response.status_code == 200:
+                result = response.json()
+                processing_time = (datetime.now() - start_time).total_seconds()
+                
+                # Extract image URL from result
+                image_url = result.get('result', {}).get('image_url')
+                
+                if image_url:
+                    logging.info(f"✅ Product background replaced successfully in {processing_time:.1f}s")
+                    return {'image_url': image_url, 'seed': result.get('result', {}).get('seed', seed)}
+                else:
+                    logging.error(f"❌ No image URL in response: {result}")
+                    return None
+            elif response.status_code == 202:
+                # Asynchronous response - poll for completion
+                result = response.json()
+                request_id = result.get('request_id')
+                status_url = result.get('status_url')
+                
+                if not request_id or not status_url:
+                    raise Exception("Missing request_id or status_url in response")
+                
+                logging.info(f"🔄 Polling status for request {request_id}...")
+                
+                if self.job_registry:
+                    self.job_registry.register(request_id, status_url)
+                
+                try:
+                    image_url = self.poll_job_status(status_url)
+                except Exception:
+                    if self.job_registry:
+                        self.job_registry.complete(request_id, None)
+                    raise
+                if self.job_registry:
+                    self.job_registry.complete(request_id, {'image_url': image_url})
+                
+                processing_time = (datetime.now() - start_time).total_seconds()
+                logging.info(f"✅ Product background replaced successfully in {processing_time:.1f}s")
+                return {'image_url': image_url, 'seed': seed}
+            else:
+                logging.error(f"❌ API returned status {response.status_code}: {response.text}")
+                return None
+                
+        except Exception as e:
+            logging.error(f"❌ Error replacing product background: {str(e)}")
+            return None
+    
+    def generate_background(self, background_prompt: str, seed: Optional[int] = None) -> Optional[str]:
+        """Generate a product-free background scene with Bria text-to-image, for local compositing"""
+        try:
+            start_time = datetime.now()
+            headers = {'api_token': self.api_token, 'Content-Type': 'application/json'}
+            data = {
+                'prompt': background_prompt,
+                'aspect_ratio': '1:1',  # Matches the square 1200x1200 shot_size used for replace_background
+                'sync': True
+            }
+            if seed is not None:
+                data['seed'] = seed
+            url = f"{self.base_url}/image/generate"
+            
+            logging.info(f"🏞️ Generating library background: '{background_prompt[:100]}...'")
+            self._log_request('POST', url, headers, json=data)
+            response = self._http('POST', url, json=data, headers=headers)
+            self._log_response(url, response)
+            
+            if response.status_code == 200:
+                image_url = response.json().get('result', {}).get('image_url')
+            elif response.status_code == 202:
+                image_url = self.poll_job_status(response.json()['status_url'])
+            else:
+                logging.error(f"❌ API returned status {response.status_code}: {response.text}")
+                return None
+            
+            self._record('bria:generate_background', (datetime.now() - start_time).total_seconds(), ok=bool(image_url))
+            logging.info(f"✅ Background generated in {(datetime.now() - start_time).total_seconds():.1f}s")
+            return image_url
+        except Exception as e:
+            logging.error(f"❌ Error generating background: {str(e)}")
+            return None
+    
+    def download_image(self, image_url: str) -> bytes:
+        """Fetch a generated image (e.g. a cutout or background) so it can be cached and composited locally"""
+        response = self._http('GET', image_url, timeout=60)
+        if response.status_code != 200:
+            raise Exception(f"Image download failed: {response.status_code}")
+        return response.content
@@ -0,0 +1,66 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """JSON response that skips FastAPI's jsonable_encoder pass over already-plain data"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict]:
+    """Parse a ?fields= projection such as "batch_id,results.status" into a selection tree"""
+    if not fields:
+        return None
+    tree: Dict = {}
+    for path in fields.split(','):
+        parts = [part for part in path.strip().split('.') if part]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            child = node.setdefault(part, {})
+            if child is None:
+                # The whole parent is already selected
+                break
+            node = child
+        else:
+            node[parts[-1]] = None
+    return tree or None
+
+
+def project(content: Any, tree: Optional[Dict]) -> Any:
+    """Keep only the selected fields; lists are projected element-wise"""
+    if tree is None:
+        return content
+    if isinstance(content, list):
+        return [project(item, tree) for item in content]
+    if isinstance(content, dict):
+        return {key: project(content[key], subtree) for key, subtree in tree.items() if key in content}
+    return content
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from utils.scheduler import rival_call
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class HedgePolicy:
+    """Fires a duplicate upstream call when the first one outlives a latency percentile
+
+    The hedge delay tracks the configured percentile of recently observed call latencies.
+    Hedges are budget-limited to a fraction of all calls so a slow upstream is never
+    flooded with duplicates. Whichever call returns a usable result first wins.
+
+    Both attempts are started by the same `call` factory as asyncio tasks, so they inherit
+    the request's context (tenant, job context, usage scope, trace) and, when the factory goes
+    through the UpstreamScheduler, each takes its own slot and passes the budget gate.
+    """
+
+    def __init__(self, percentile: float = 0.95, budget_ratio: float = 0.1, min_samples: int = 20):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        # Latency of every individual call, primary or hedge (drives the hedge delay)
+        self._call_latencies = deque(maxlen=1000)
+        # Latency of first attempts only: what callers would see without hedging
+        self._primary_latencies = deque(maxlen=1000)
+        # Latency the caller actually experienced
+        self._effective_latencies = deque(maxlen=1000)
+        self._savings = deque(maxlen=1000)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if len(self._call_latencies) < self.min_samples:
+                return None
+            return _percentile(self._call_latencies, self.percentile)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget_ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _record_call(self, future: asyncio.Future, started: float, primary: bool):
+        # Retrieve the outcome so a losing attempt's exception is not reported as unhandled
+        if future.cancelled() or future.exception() is not None:
+            return
+        latency = time.monotonic() - started
+        with self._lock:
+            self._call_latencies.append(latency)
+            if primary:
+                self._primary_latencies.append(latency)
+
+    def _record_effective(self, started: float) -> float:
+        effective = time.monotonic() - started
+        with self._lock:
+            self._effective_latencies.append(effective)
+        return effective
+
+    def _record_savings(self, seconds: float):
+        with self._lock:
+            self._savings.append(seconds)
+
+    @staticmethod
+    def _usable(future: asyncio.Future) -> bool:
+        return not future.cancelled() and future.exception() is None and future.result() is not None
+
+    async def run(self, call: Callable[[], Awaitable]):
+        """Await call(), hedging with a second call() if the first is slower than the hedge delay"""
+        with self._lock:
+            self.calls += 1
+        start = time.monotonic()
+        delay = self.hedge_delay()
+
+        primary = asyncio.ensure_future(call())
+        primary.add_done_callback(lambda f: self._record_call(f, start, primary=True))
+
+        if delay is not None:
+            await asyncio.wait({primary}, timeout=delay)
+        if delay is None or primary.done() or not self._take_budget():
+            try:
+                return await primary
+            finally:
+                self._record_effective(start)
+
+        logger.info(f"🪞 Hedging upstream call after {delay:.1f}s")
+        hedge_start = time.monotonic()
+        # The hedge task copies this context, so the scheduler drops it if the primary answers first
+        token = rival_call.set(primary)
+        try:
+            hedge = asyncio.ensure_future(call())
+        finally:
+            rival_call.reset(token)
+        hedge.add_done_callback(lambda f: self._record_call(f, hedge_start, primary=False))
+
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                usable = [f for f in done if self._usable(f)]
+                if usable:
+                    winner = primary if primary in usable else hedge
+                    break
+        except asyncio.CancelledError:
+            primary.cancel()
+            hedge.cancel()
+            raise
+
+        effective = self._record_effective(start)
+
+        if winner is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+            # Credit the savings once the losing primary call eventually finishes; it keeps its
+            # scheduler slot until then, so concurrency accounting stays accurate
+            primary.add_done_callback(lambda f: self._record_savings(time.monotonic() - start - effective))
+            return hedge.result()
+        # Primary won, or neither call produced a usable result and the primary outcome is surfaced.
+        # Drop the hedge so a duplicate still at the budget gate or queued for a slot is never sent
+        hedge.cancel()
+        return primary.result()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            effective_p99 = _percentile(self._effective_latencies, 0.99)
+            unhedged_p99 = _percentile(self._primary_latencies, 0.99)
+            return {
+                'percentile': self.percentile,
+                'budget_ratio': self.budget_ratio,
+                'hedge_delay_seconds': round(_percentile(self._call_latencies, self.percentile), 3) if len(self._call_latencies) >= self.min_samples else None,
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': round(self.hedges / self.calls, 4) if self.calls else 0.0,
+                'p99_latency_seconds': round(effective_p99, 3) if effective_p99 is not None else None,
+                'p99_unhedged_latency_seconds': round(unhedged_p99, 3) if unhedged_p99 is not None else None,
+                'p99_savings_seconds': round(unhedged_p99 - effective_p99, 3) if effective_p99 is not None and unhedged_p99 is not None else None,
+                'total_seconds_saved': round(sum(self._savings), 3)
+            }
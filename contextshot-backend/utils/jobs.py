@@ -0,0 +1,90 @@
+import contextvars
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# What an upstream call is working on (e.g. batch id and item index), recorded with any async Bria job it starts
+job_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('job_context', default=None)
+
+
+class PendingJobRegistry:
+    """Persists asynchronous Bria jobs (request_id + status_url) until their result is collected
+
+    Jobs are owned by the process that submitted them. On graceful shutdown a process
+    releases its unfinished jobs so the next process resumes polling them instead of
+    paying Bria to run the same work again.
+    """
+
+    PENDING_KEY = 'jobs:pending'
+
+    def __init__(self, backend: StateBackend, stale_after: float = 600, result_ttl: float = 24 * 3600):
+        self.backend = backend
+        self.owner_id = uuid.uuid4().hex
+        self.stale_after = stale_after
+        self.result_ttl = result_ttl
+
+    def register(self, request_id: str, status_url: str):
+        """Record a submitted job before polling starts"""
+        self.backend.hset(self.PENDING_KEY, request_id, {
+            'request_id': request_id,
+            'status_url': status_url,
+            'owner': self.owner_id,
+            'submitted_at': time.time(),
+            'context': job_context.get()
+        })
+
+    def complete(self, request_id: str, result: Optional[Dict] = None):
+        """Drop a job from the pending set, keeping its result for later lookup"""
+        self.backend.set(f"job:{request_id}:result", {
+            'request_id': request_id,
+            'status': 'completed' if result else 'failed',
+            'result': result,
+            'completed_at': time.time()
+        }, ttl=self.result_ttl)
+        self.backend.hdel(self.PENDING_KEY, request_id)
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        pending = self.backend.hgetall(self.PENDING_KEY).get(request_id)
+        if pending:
+            return {'request_id': request_id, 'status': 'pending', 'submitted_at': pending['submitted_at']}
+        return self.backend.get(f"job:{request_id}:result")
+
+    def pending(self) -> List[Dict]:
+        return list(self.backend.hgetall(self.PENDING_KEY).values())
+
+    def release_owned(self) -> int:
+        """Hand this process's unfinished jobs over to whichever process starts next"""
+        released = 0
+        for job in self.pending():
+            if job.get('owner') == self.owner_id:
+                job['owner'] = None
+                self.backend.hset(self.PENDING_KEY, job['request_id'], job)
+                released += 1
+        return released
+
+    def resumable(self) -> List[Dict]:
+        """Jobs released on shutdown, or whose owner stopped without releasing them"""
+        now = time.time()
+        return [
+            job for job in self.pending()
+            if job.get('owner') is None or now - job.get('submitted_at', now) > self.stale_after
+        ]
+
+    def claim(self, request_id: str, lease_seconds: float = 300) -> bool:
+        """Take ownership of a resumable job; only one process wins each lease"""
+        claim_key = f"job:{request_id}:claim"
+        if self.backend.incr(claim_key) != 1:
+            return False
+        self.backend.expire(claim_key, lease_seconds)
+        job = self.backend.hgetall(self.PENDING_KEY).get(request_id)
+        if job is None:
+            return False
+        job['owner'] = self.owner_id
+        job['submitted_at'] = time.time()
+        self.backend.hset(self.PENDING_KEY, request_id, job)
+        return True
@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from utils.assets import AssetNotFound, AssetStore, sniff_mime
+from utils.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLibrary:
+    """Generated backgrounds (one per prompt + seed) and product cutouts (one per image), kept as assets
+
+    Lookups go through the shared-state backend, so every worker reuses what any worker
+    generated. Within a worker, concurrent requests for a missing entry share one upstream call.
+    """
+
+    def __init__(self, backend: StateBackend, assets: AssetStore):
+        self.backend = backend
+        self.assets = assets
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {kind: {'hits': 0, 'created': 0} for kind in ('background', 'cutout')}
+
+    @staticmethod
+    def background_key(prompt: str, seed: Optional[int]) -> str:
+        return hashlib.sha256(f"{seed}|{prompt}".encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def cutout_key(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()[:32]
+
+    def lookup(self, kind: str, key: str) -> Optional[Dict]:
+        asset_id = self.backend.get(f"library:{kind}:{key}")
+        if asset_id is None:
+            return None
+        try:
+            return self.assets.get(asset_id)
+        except AssetNotFound:
+            return None
+
+    async def get_or_create(self, kind: str, key: str, create: Callable[[], Awaitable[bytes]]) -> Dict:
+        """Library asset for `key`, calling `create` for its bytes only if no worker has it yet"""
+        asset = await asyncio.to_thread(self.lookup, kind, key)
+        if asset is not None:
+            self.counters[kind]['hits'] += 1
+            return asset
+        name = f"{kind}:{key}"
+        task = self._inflight.get(name)
+        if task is None:
+            task = self._inflight[name] = asyncio.ensure_future(self._create(kind, key, create))
+            task.add_done_callback(lambda _: self._inflight.pop(name, None))
+        else:
+            self.counters[kind]['hits'] += 1
+        # Shielded so one cancelled waiter does not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _create(self, kind: str, key: str, create: Callable[[], Awaitable[bytes]]) -> Dict:
+        content = await create()
+        asset = await asyncio.to_thread(self.assets.put, content, f"{kind}_{key}", sniff_mime(content))
+        await asyncio.to_thread(self.backend.set, f"library:{kind}:{key}", asset['asset_id'], ttl=self.assets.ttl_seconds)
+        self.counters[kind]['created'] += 1
+        logger.info(f"📚 Added {kind} {asset['asset_id']} to the library")
+        return asset
+
+    def snapshot(self) -> Dict:
+        return {'in_flight': len(self._inflight), **self.counters}
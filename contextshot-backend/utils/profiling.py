@@ -0,0 +1,216 @@
+import contextvars
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTrace:
+    """Per-stage timings of one HTTP request
+
+    Spans are appended from the event loop and from worker threads (asyncio.to_thread copies
+    the context), so list.append keeps recording lock-free. Very frequent stages such as
+    logging are only summed, not kept as individual spans.
+    """
+    MAX_SPANS = 500
+
+    def __init__(self, method: str, path: str, tenant: str):
+        self.method = method
+        self.path = path
+        self.tenant = tenant
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []
+        self.totals: List[tuple] = []
+
+    def add(self, stage: str, started: float, duration: float, detail: bool = True):
+        if detail and len(self.spans) < self.MAX_SPANS:
+            self.spans.append((stage, started - self.started, duration, threading.current_thread().name))
+        else:
+            self.totals.append((stage, duration))
+
+    def to_dict(self, status_code: int, duration: float) -> Dict:
+        stages: Dict[str, Dict] = {}
+        for stage, duration_s in [(s[0], s[2]) for s in self.spans] + self.totals:
+            summary = stages.setdefault(stage, {'count': 0, 'total_ms': 0.0})
+            summary['count'] += 1
+            summary['total_ms'] += duration_s * 1000
+        for summary in stages.values():
+            summary['total_ms'] = round(summary['total_ms'], 1)
+        return {
+            'method': self.method,
+            'path': self.path,
+            'tenant': self.tenant,
+            'status_code': status_code,
+            'started_at': self.started_at,
+            'duration_ms': round(duration * 1000, 1),
+            # Stages overlap when work runs concurrently, so totals can exceed the request time
+            'stages': dict(sorted(stages.items(), key=lambda item: -item[1]['total_ms'])),
+            'spans': [
+                {'stage': stage, 'offset_ms': round(offset * 1000, 1), 'duration_ms': round(d * 1000, 1), 'thread': thread}
+                for stage, offset, d, thread in self.spans
+            ]
+        }
+
+
+# Trace of the request currently being served; set by the HTTP layer
+request_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('request_trace', default=None)
+
+
+def record_stage(stage: str, started: float, detail: bool = True):
+    """Close a stage that began at perf_counter() value `started` on the current request's trace"""
+    trace = request_trace.get()
+    if trace is not None:
+        trace.add(stage, started, time.perf_counter() - started, detail)
+
+
+@contextmanager
+def trace_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, started)
+
+
+class SlowRequestLog:
+    """Ring buffer of the last `capacity` traces of requests slower than the threshold"""
+
+    def __init__(self, threshold_ms: float, capacity: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.entries = deque(maxlen=capacity)
+        self.captured = 0
+
+    def finish(self, trace: RequestTrace, status_code: int):
+        duration = time.perf_counter() - trace.started
+        if self.threshold > 0 and duration >= self.threshold:
+            self.entries.append(trace.to_dict(status_code, duration))
+            self.captured += 1
+            logger.warning(f"🐢 Slow request {trace.method} {trace.path}: {duration * 1000:.0f}ms (status {status_code})")
+
+    def recent(self, limit: Optional[int] = None, path: Optional[str] = None) -> List[Dict]:
+        entries = [entry for entry in reversed(self.entries) if path is None or entry['path'] == path]
+        return entries[:limit] if limit else entries
+
+
+def instrument_logging():
+    """Count time spent in log handlers against the current request's 'logging' stage"""
+    for handler in logging.getLogger().handlers:
+        if getattr(handler, '_traced', False):
+            continue
+        original = handler.handle
+
+        def handle(record, original=original):
+            started = time.perf_counter()
+            try:
+                return original(record)
+            finally:
+                record_stage('logging', started, detail=False)
+
+        handler.handle = handle
+        handler._traced = True
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is still running"""
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's stack from a background thread
+
+    Nothing is instrumented while it is idle. Results are kept in the collapsed-stack
+    format ("thread;frame;frame count" per line) read by flamegraph.pl and speedscope.
+    Each tick is collected locally and merged under the lock, and readers copy under it.
+    """
+
+    def __init__(self, max_seconds: float = 300):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.seconds = 0.0
+        self.interval = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.01):
+        if seconds <= 0 or seconds > self.max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self.max_seconds}")
+        if interval < 0.001:
+            raise ValueError("interval must be at least 0.001 seconds")
+        with self._lock:
+            if self.running:
+                raise ProfilerBusy("A profile is already running")
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at, self.finished_at = time.time(), None
+            self.seconds, self.interval = seconds, interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Sampling profile started for {seconds}s every {interval * 1000:.0f}ms")
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            tick: Counter = Counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                tick[';'.join(reversed(stack))] += 1
+            with self._lock:
+                self.stacks.update(tick)
+                self.samples += 1
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+        logger.info(f"🔬 Sampling profile finished: {self.samples} samples, {len(self.stacks)} distinct stacks")
+
+    def _copy(self):
+        with self._lock:
+            return Counter(self.stacks), self.samples
+
+    def collapsed(self) -> str:
+        stacks, _ = self._copy()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def snapshot(self, top: int = 20) -> Dict:
+        # Leaf frames are where the sampled threads were actually spending time
+        stacks, samples = self._copy()
+        leaves: Counter = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values())
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'samples': samples,
+            'top_frames': [
+                {'frame': frame, 'samples': count, 'share': round(count / total, 4)}
+                for frame, count in leaves.most_common(top)
+            ]
+        }
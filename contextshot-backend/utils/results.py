@@ -0,0 +1,55 @@
+import sys
+from typing import Any, Dict, List, Optional, Union
+
+# Status strings are interned so thousands of records share one object per status
+STATUS_CODES = {'pending': 0, 'success': 1, 'failed': 2, 'interrupted': 3, 'quota_exceeded': 4}
+STATUS_NAMES = {code: sys.intern(name) for name, code in STATUS_CODES.items()}
+
+# Row layout after the status code; trailing empty columns are not stored
+ROW_FIELDS = ('product_name', 'product_no_bg_url', 'background_url', 'final_image_url', 'error', 'processing_time')
+
+
+def default_product_name(index: int) -> str:
+    return f"Product_{index + 1}"
+
+
+class ResultRecord:
+    """Compact per-item batch result; Pydantic models are only built at the response boundary"""
+    __slots__ = ('product_name', 'status', 'product_no_bg_url', 'background_url', 'final_image_url', 'error', 'processing_time')
+
+    def __init__(self, product_name: str, status: str, product_no_bg_url: Optional[str] = None,
+                 background_url: Optional[str] = None, final_image_url: Optional[str] = None,
+                 error: Optional[str] = None, processing_time: Optional[str] = None):
+        self.product_name = product_name
+        self.status = sys.intern(status)
+        self.product_no_bg_url = product_no_bg_url
+        self.background_url = background_url
+        self.final_image_url = final_image_url
+        self.error = error
+        self.processing_time = processing_time
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ResultRecord':
+        return cls(**{name: data.get(name) for name in cls.__slots__ if data.get(name) is not None})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_row(self, index: int) -> List[Any]:
+        """Positional storage form: [status, product_name, urls..., error, processing_time]"""
+        status = STATUS_CODES.get(self.status, self.status)
+        name = None if self.product_name == default_product_name(index) else self.product_name
+        row = [status, name, self.product_no_bg_url, self.background_url, self.final_image_url, self.error, self.processing_time]
+        while len(row) > 1 and row[-1] is None:
+            row.pop()
+        return row
+
+    @classmethod
+    def from_row(cls, row: Union[List[Any], Dict[str, Any]], index: int) -> 'ResultRecord':
+        if isinstance(row, dict):
+            # Items written before the positional layout
+            return cls.from_dict(row)
+        status = STATUS_NAMES.get(row[0], row[0])
+        columns = dict(zip(ROW_FIELDS, row[1:]))
+        columns['product_name'] = columns.get('product_name') or default_product_name(index)
+        return cls(status=status, **{name: value for name, value in columns.items() if value is not None})
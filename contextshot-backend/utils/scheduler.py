@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from utils.profiling import record_stage
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerClosed(Exception):
+    """Raised for calls submitted after the scheduler started draining"""
+
+
+class CallSuperseded(Exception):
+    """Raised for a duplicate call whose rival already produced a result before it got a slot"""
+
+# Tenant of the request currently being served; set by the HTTP layer
+current_tenant: contextvars.ContextVar[str] = contextvars.ContextVar('current_tenant', default='default')
+
+# Set around a duplicate attempt (e.g. a hedge) to the attempt it races; once that one has a
+# result, the duplicate gives its slot back instead of starting the upstream call
+rival_call: contextvars.ContextVar[Optional[asyncio.Future]] = contextvars.ContextVar('rival_call', default=None)
+
+
+def _superseded() -> bool:
+    rival = rival_call.get()
+    return rival is not None and rival.done() and not rival.cancelled() and rival.exception() is None and rival.result() is not None
+
+# Relative share of upstream capacity per priority class (highest first)
+DEFAULT_PRIORITY_WEIGHTS = {
+    'draft': 12,
+    'interactive': 8,
+    'final': 6,
+    'reference': 4,
+    'batch': 1
+}
+
+
+class _Ticket:
+    __slots__ = ('future', 'enqueued_at')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ClassStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=256)
+
+    def record_wait(self, wait: float):
+        self.started += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+
+class UpstreamScheduler:
+    """Weighted priority scheduler bounding concurrent upstream (Bria/Claude) calls
+
+    Each priority class is scored by its weight, boosted by how long the head of its
+    queue has been waiting, so low-priority batch work is delayed but never starved.
+    Within a class, tenants are served round-robin.
+    """
+
+    def __init__(self, max_concurrency: int = 4, weights: Optional[Dict[str, int]] = None, aging_seconds: float = 10.0):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.weights = dict(weights or DEFAULT_PRIORITY_WEIGHTS)
+        self.aging_seconds = aging_seconds
+        # Optional callable returning False while a shared (cross-worker) rate limit is exhausted
+        self.rate_limiter = None
+        self.rate_limit_backoff = 0.5
+        # Optional callable(priority, func) returning seconds to hold a call back, or raising to reject it
+        self.budget_gate = None
+        # Optional callable(priority, func) metering each call once, when it is dispatched upstream;
+        # it may raise to reject the call (e.g. when concurrent calls would overshoot a budget)
+        self.meter = None
+        # Optional StatsRecorder; every call's latency and outcome is recorded per upstream function,
+        # and its end-to-end latency (queueing included) per priority class
+        self.recorder = None
+        self.in_flight = 0
+        # Blocking calls still running in worker threads, including ones whose caller was cancelled
+        self.active_calls = 0
+        self._active_lock = threading.Lock()
+        self.closed = False
+        self.queues: Dict[str, OrderedDict] = {name: OrderedDict() for name in self.weights}
+        self.stats: Dict[str, _ClassStats] = {name: _ClassStats() for name in self.weights}
+
+    def _queued(self, priority: str) -> int:
+        return sum(len(q) for q in self.queues[priority].values())
+
+    def _head(self, priority: str) -> Optional[_Ticket]:
+        for tickets in self.queues[priority].values():
+            if tickets:
+                return tickets[0]
+        return None
+
+    def _pick_class(self) -> Optional[str]:
+        now = time.monotonic()
+        best, best_score = None, -1.0
+        for priority, weight in self.weights.items():
+            head = self._head(priority)
+            if head is None:
+                continue
+            age = now - head.enqueued_at
+            score = weight * (1 + age / self.aging_seconds)
+            if score > best_score:
+                best, best_score = priority, score
+        return best
+
+    def _pop(self, priority: str) -> _Ticket:
+        tenants = self.queues[priority]
+        tenant, tickets = next(iter(tenants.items()))
+        ticket = tickets.popleft()
+        # Rotate the tenant to the back so other tenants get the next turn
+        del tenants[tenant]
+        if tickets:
+            tenants[tenant] = tickets
+        return ticket
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            priority = self._pick_class()
+            if priority is None:
+                return
+            ticket = self._pop(priority)
+            if ticket.future.done():
+                continue
+            self.in_flight += 1
+            ticket.future.set_result(priority)
+
+    def _discard(self, priority: str, tenant: str, ticket: _Ticket):
+        tickets = self.queues[priority].get(tenant)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self.queues[priority][tenant]
+
+    async def _acquire(self, priority: str, tenant: str):
+        ticket = _Ticket(asyncio.get_running_loop().create_future())
+        self.queues[priority].setdefault(tenant, deque()).append(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None:
+                # Slot was granted just as we were cancelled; give it back
+                self._release()
+            else:
+                self._discard(priority, tenant, ticket)
+            raise
+        self.stats[priority].record_wait(time.monotonic() - ticket.enqueued_at)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _record(self, func, started: float, ok: bool):
+        name = f"upstream:{getattr(func, '__name__', 'call')}"
+        if self.recorder is not None:
+            self.recorder.record(name, time.perf_counter() - started, ok)
+        record_stage(name, started)
+
+    def _tracked(self, submitted: float, func, *args, **kwargs):
+        record_stage('thread_pool_wait', submitted)
+        with self._active_lock:
+            self.active_calls += 1
+        started, ok = time.perf_counter(), False
+        try:
+            result = func(*args, **kwargs)
+            ok = result is not None
+            return result
+        finally:
+            # Recorded from the worker thread, so it lands in that thread's stats shard
+            self._record(func, started, ok)
+            with self._active_lock:
+                self.active_calls -= 1
+
+    async def _awaited(self, func, *args, **kwargs):
+        started, ok = time.perf_counter(), False
+        try:
+            result = await func(*args, **kwargs)
+            ok = result is not None
+            return result
+        finally:
+            self._record(func, started, ok)
+
+    def close(self):
+        """Stop accepting calls and drop queued ones; calls already running continue"""
+        self.closed = True
+        for priority, tenants in self.queues.items():
+            for tickets in tenants.values():
+                for ticket in tickets:
+                    if not ticket.future.done():
+                        ticket.future.set_exception(SchedulerClosed("Upstream scheduler is shutting down"))
+            tenants.clear()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until no upstream call is running; False if the deadline passed first"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight or self.active_calls:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    async def run(self, priority: str, func, *args, tenant: Optional[str] = None, **kwargs):
+        """Run an upstream call once a slot is granted to its priority class
+
+        Coroutine functions are awaited on the loop; blocking functions run in a worker thread.
+        The budget gate, rate limiter and meter may touch the shared-state backend, so they
+        run in worker threads too.
+        """
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+        if self.closed:
+            raise SchedulerClosed("Upstream scheduler is shutting down")
+        tenant = tenant or current_tenant.get()
+        queued = time.perf_counter()
+        if self.budget_gate is not None:
+            delay = await asyncio.to_thread(self.budget_gate, priority, func)
+            if delay:
+                await asyncio.sleep(delay)
+        await self._acquire(priority, tenant)
+        record_stage(f"upstream_queue:{priority}", queued)
+        stats = self.stats[priority]
+        stats.in_flight += 1
+        ok = False
+        try:
+            while self.rate_limiter is not None and not await asyncio.to_thread(self.rate_limiter):
+                await asyncio.sleep(self.rate_limit_backoff)
+            if _superseded():
+                # A slot can be handed over before the rival's caller resumes to cancel this call
+                raise CallSuperseded(f"{getattr(func, '__name__', 'call')} was already answered by its rival")
+            if self.meter is not None:
+                await asyncio.to_thread(self.meter, priority, func)
+            if asyncio.iscoroutinefunction(func):
+                result = await self._awaited(func, *args, **kwargs)
+            else:
+                result = await asyncio.to_thread(self._tracked, time.perf_counter(), func, *args, **kwargs)
+            ok = result is not None
+            return result
+        finally:
+            stats.in_flight -= 1
+            stats.completed += 1
+            self._release()
+            if self.recorder is not None:
+                self.recorder.record(f"class:{priority}", time.perf_counter() - queued, ok)
+
+    def snapshot(self) -> Dict:
+        """Per-class queue depth and wait time"""
+        classes = {}
+        for priority, stats in self.stats.items():
+            waits = sorted(stats.recent_waits)
+            head = self._head(priority)
+            classes[priority] = {
+                'weight': self.weights[priority],
+                'queue_depth': self._queued(priority),
+                'tenants_waiting': len(self.queues[priority]),
+                'in_flight': stats.in_flight,
+                'completed': stats.completed,
+                'avg_wait_seconds': round(stats.total_wait / stats.started, 3) if stats.started else 0.0,
+                'p95_wait_seconds': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                'max_wait_seconds': round(stats.max_wait, 3),
+                'oldest_queued_seconds': round(time.monotonic() - head.enqueued_at, 3) if head else 0.0
+            }
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'active_calls': self.active_calls,
+            'classes': classes
+        }
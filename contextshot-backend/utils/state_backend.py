@@ -0,0 +1,446 @@
+import json
+import logging
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackendError(Exception):
+    """Raised when the shared-state backend rejects or fails a command"""
+
+
+class StateBackend:
+    """Shared state visible to every worker process: JSON values, counters, lists and rate limits
+
+    Values are JSON-serialisable objects. Implementations must be safe to call from
+    multiple threads and multiple processes at once.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Atomically set a key unless it already holds a live value; returns whether it was set"""
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        raise NotImplementedError
+
+    def hincr(self, key: str, field: str, amount: float = 1) -> float:
+        raise NotImplementedError
+
+    def hset(self, key: str, field: str, value: Any):
+        raise NotImplementedError
+
+    def hdel(self, key: str, field: str):
+        raise NotImplementedError
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def rpush(self, key: str, *values: Any) -> int:
+        """Append to a list and return its new length"""
+        raise NotImplementedError
+
+    def lset(self, key: str, index: int, value: Any):
+        raise NotImplementedError
+
+    def lrange(self, key: str, start: int = 0, stop: int = -1) -> List[Any]:
+        raise NotImplementedError
+
+    def allow(self, key: str, limit: int, window_seconds: float) -> bool:
+        """Fixed-window rate limit: True if another hit fits in the current window"""
+        window = int(time.time() // window_seconds)
+        bucket = f"ratelimit:{key}:{window}"
+        hits = self.incr(bucket)
+        if hits == 1:
+            self.expire(bucket, window_seconds * 2)
+        return hits <= limit
+
+    def expire(self, key: str, ttl: float):
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """Drop expired keys that nothing has read since; backends that expire natively do nothing"""
+        return 0
+
+
+class SQLiteBackend(StateBackend):
+    """Default backend: a WAL-mode SQLite file shared by all workers on one host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL);
+            CREATE TABLE IF NOT EXISTS hashes (key TEXT, field TEXT, value, PRIMARY KEY (key, field));
+            CREATE TABLE IF NOT EXISTS lists (key TEXT, idx INTEGER, value TEXT, PRIMARY KEY (key, idx));
+            CREATE TABLE IF NOT EXISTS expiries (key TEXT PRIMARY KEY, expires_at REAL);
+            CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at) WHERE expires_at IS NOT NULL;
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _drop(conn: sqlite3.Connection, key: str):
+        for table in ('kv', 'hashes', 'lists', 'expiries'):
+            conn.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+    def _live(self, conn: sqlite3.Connection, key: str):
+        """Drop a hash or list whose TTL has passed, so reads and writes see it as missing (as Redis does)"""
+        row = conn.execute('SELECT expires_at FROM expiries WHERE key = ?', (key,)).fetchone()
+        if row is not None and row[0] < time.time():
+            self.delete(key)
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), expires_at)
+        )
+
+    def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at < ?', (key, time.time()))
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            ).rowcount
+            conn.execute('COMMIT')
+            return inserted == 1
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, *keys: str):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for key in keys:
+                self._drop(conn, key)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def expire(self, key: str, ttl: float):
+        conn = self._conn()
+        expires_at = time.time() + ttl
+        conn.execute('UPDATE kv SET expires_at = ? WHERE key = ?', (expires_at, key))
+        # Hashes and lists have no expiry column; their TTL lives in a side table
+        if conn.execute(
+            'SELECT 1 FROM hashes WHERE key = ? UNION ALL SELECT 1 FROM lists WHERE key = ? LIMIT 1', (key, key)
+        ).fetchone():
+            conn.execute('INSERT OR REPLACE INTO expiries (key, expires_at) VALUES (?, ?)', (key, expires_at))
+
+    def sweep(self) -> int:
+        """Delete every expired key; expired rows are otherwise only removed when read"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?', (now,)).rowcount
+            expired = [row[0] for row in conn.execute('SELECT key FROM expiries WHERE expires_at < ?', (now,)).fetchall()]
+            for key in expired:
+                self._drop(conn, key)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return removed + len(expired)
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+            expired = row is not None and row[1] is not None and row[1] < time.time()
+            current = 0 if row is None or expired else json.loads(row[0])
+            value = current + amount
+            expires_at = None if row is None or expired else row[1]
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            conn.execute('COMMIT')
+            return value
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def hincr(self, key: str, field: str, amount: float = 1) -> float:
+        conn = self._conn()
+        self._live(conn, key)
+        conn.execute(
+            'INSERT INTO hashes (key, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (key, field) DO UPDATE SET value = value + excluded.value',
+            (key, field, amount)
+        )
+        row = conn.execute('SELECT value FROM hashes WHERE key = ? AND field = ?', (key, field)).fetchone()
+        return row[0]
+
+    def hset(self, key: str, field: str, value: Any):
+        # JSON documents are stored as text; counters written by hincr stay numeric
+        conn = self._conn()
+        self._live(conn, key)
+        conn.execute(
+            'INSERT OR REPLACE INTO hashes (key, field, value) VALUES (?, ?, ?)', (key, field, json.dumps(value))
+        )
+
+    def hdel(self, key: str, field: str):
+        self._conn().execute('DELETE FROM hashes WHERE key = ? AND field = ?', (key, field))
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        conn = self._conn()
+        self._live(conn, key)
+        rows = conn.execute('SELECT field, value FROM hashes WHERE key = ?', (key,)).fetchall()
+        return {field: json.loads(value) if isinstance(value, str) else value for field, value in rows}
+
+    def rpush(self, key: str, *values: Any) -> int:
+        conn = self._conn()
+        self._live(conn, key)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            length = conn.execute('SELECT COUNT(*) FROM lists WHERE key = ?', (key,)).fetchone()[0]
+            conn.executemany(
+                'INSERT INTO lists (key, idx, value) VALUES (?, ?, ?)',
+                [(key, length + i, json.dumps(value)) for i, value in enumerate(values)]
+            )
+            conn.execute('COMMIT')
+            return length + len(values)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def lset(self, key: str, index: int, value: Any):
+        conn = self._conn()
+        self._live(conn, key)
+        cursor = conn.execute(
+            'UPDATE lists SET value = ? WHERE key = ? AND idx = ?', (json.dumps(value), key, index)
+        )
+        if cursor.rowcount == 0:
+            raise StateBackendError(f"Index {index} out of range for list {key}")
+
+    def lrange(self, key: str, start: int = 0, stop: int = -1) -> List[Any]:
+        conn = self._conn()
+        self._live(conn, key)
+        rows = conn.execute('SELECT value FROM lists WHERE key = ? ORDER BY idx', (key,)).fetchall()
+        stop = len(rows) if stop == -1 else stop + 1
+        return [json.loads(row[0]) for row in rows[start:stop]]
+
+
+class RedisBackend(StateBackend):
+    """Backend speaking the Redis wire protocol (RESP) for multi-host deployments
+
+    A command is resent on a new connection only if the server cannot have seen it: the
+    connection was never established, or (for idempotent commands) not a byte was written.
+    A timeout or dropped connection after that is raised, since INCRBYFLOAT, RPUSH and the
+    like may already have been applied.
+    """
+
+    # Safe to send twice; SET is only retried without NX, whose second reply would be wrong
+    IDEMPOTENT_COMMANDS = {'GET', 'SET', 'DEL', 'PEXPIRE', 'HSET', 'HDEL', 'HGETALL', 'LRANGE'}
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, password: Optional[str] = None, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        try:
+            if self.password:
+                self._send('AUTH', self.password)
+            if self.db:
+                self._send('SELECT', self.db)
+        except Exception:
+            # Never keep a connection that is not authenticated and on the right database
+            self._close()
+            raise
+
+    def _stale(self) -> bool:
+        """Whether the idle connection was closed by the server, e.g. across a restart"""
+        sock = self._local.sock
+        try:
+            # An idle connection only turns readable when the server closed it
+            if not select.select([sock], [], [], 0)[0]:
+                return False
+            return sock.recv(1, socket.MSG_PEEK) == b''
+        except (OSError, ValueError):
+            return True
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by state backend")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            raise StateBackendError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2].decode('utf-8')
+        if prefix == b'*':
+            count = int(payload)
+            if count == -1:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise StateBackendError(f"Unexpected reply: {line!r}")
+
+    def _send(self, *args):
+        self._write(self._encode(*args))
+        return self._read_reply()
+
+    def _write(self, data: bytes):
+        written = 0
+        try:
+            while written < len(data):
+                written += self._local.sock.send(data[written:])
+        except OSError as e:
+            e.nothing_written = written == 0
+            raise
+
+    def _command(self, *args):
+        retryable = args[0] in self.IDEMPOTENT_COMMANDS and 'NX' not in args[1:]
+        # One reconnect attempt keeps workers alive across backend restarts
+        for attempt in range(2):
+            try:
+                if getattr(self._local, 'sock', None) is not None and self._stale():
+                    self._close()
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+            except OSError:
+                # Nothing was sent, so any command can try once more
+                if attempt:
+                    raise
+                continue
+            try:
+                return self._send(*args)
+            except OSError as e:
+                self._close()
+                if attempt or not (retryable and getattr(e, 'nothing_written', False)):
+                    raise
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._command('GET', key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if ttl:
+            self._command('SET', key, json.dumps(value), 'PX', int(ttl * 1000))
+        else:
+            self._command('SET', key, json.dumps(value))
+
+    def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        if ttl:
+            return self._command('SET', key, json.dumps(value), 'NX', 'PX', int(ttl * 1000)) is not None
+        return self._command('SET', key, json.dumps(value), 'NX') is not None
+
+    def delete(self, *keys: str):
+        if keys:
+            self._command('DEL', *keys)
+
+    def expire(self, key: str, ttl: float):
+        self._command('PEXPIRE', key, int(ttl * 1000))
+
+    def incr(self, key: str, amount: float = 1) -> float:
+        return float(self._command('INCRBYFLOAT', key, amount))
+
+    def hincr(self, key: str, field: str, amount: float = 1) -> float:
+        return float(self._command('HINCRBYFLOAT', key, field, amount))
+
+    def hset(self, key: str, field: str, value: Any):
+        self._command('HSET', key, field, json.dumps(value))
+
+    def hdel(self, key: str, field: str):
+        self._command('HDEL', key, field)
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        flat = self._command('HGETALL', key) or []
+        return {flat[i]: json.loads(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    def rpush(self, key: str, *values: Any) -> int:
+        return self._command('RPUSH', key, *[json.dumps(value) for value in values])
+
+    def lset(self, key: str, index: int, value: Any):
+        self._command('LSET', key, index, json.dumps(value))
+
+    def lrange(self, key: str, start: int = 0, stop: int = -1) -> List[Any]:
+        return [json.loads(value) for value in self._command('LRANGE', key, start, stop) or []]
+
+
+def create_state_backend(url: Optional[str] = None) -> StateBackend:
+    """Build a backend from a URL: sqlite:///path/to/state.db or redis://[:password@]host:port/db"""
+    url = url or os.getenv('STATE_BACKEND_URL') or 'sqlite:///' + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'contextshot_state.db')
+    parsed = urlparse(url)
+
+    if parsed.scheme == 'sqlite':
+        path = parsed.path[1:]
+        logger.info(f"🗄️ Using SQLite state backend: {path}")
+        return SQLiteBackend(path)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.lstrip('/') or 0)
+        logger.info(f"🗄️ Using Redis state backend: {parsed.hostname}:{parsed.port or 6379}/{db}")
+        return RedisBackend(parsed.hostname or 'localhost', parsed.port or 6379, db, parsed.password)
+
+    raise ValueError(f"Unsupported state backend URL: {url}")
@@ -0,0 +1,180 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Latency histogram: bin i holds samples up to _BASE * _GROWTH ** i seconds (10ms .. ~1.5h)
+_BASE = 0.01
+_GROWTH = 1.25
+_BINS = 60
+
+BUCKET_SECONDS = 10
+WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+_RETAIN_BUCKETS = WINDOWS['1h'] // BUCKET_SECONDS + 1
+
+# Per-metric record: (count, errors, total_latency, histogram). Records are immutable and
+# replaced with a single dict store, so readers never observe a half-applied update.
+_Record = Tuple[int, int, float, Tuple[int, ...]]
+_EMPTY_HISTOGRAM = (0,) * _BINS
+
+
+def _bin(seconds: float) -> int:
+    if seconds <= _BASE:
+        return 0
+    return min(_BINS - 1, int(math.ceil(math.log(seconds / _BASE, _GROWTH))))
+
+
+def _add(record: Optional[_Record], ok: bool, seconds: Optional[float]) -> _Record:
+    count, errors, total, histogram = record or (0, 0, 0.0, _EMPTY_HISTOGRAM)
+    if seconds is not None:
+        index = _bin(seconds)
+        histogram = histogram[:index] + (histogram[index] + 1,) + histogram[index + 1:]
+        total += seconds
+    return count + 1, errors + (0 if ok else 1), total, histogram
+
+
+def _merge(a: Optional[_Record], b: _Record) -> _Record:
+    if a is None:
+        return b
+    return a[0] + b[0], a[1] + b[1], a[2] + b[2], tuple(x + y for x, y in zip(a[3], b[3]))
+
+
+def _subtract(a: _Record, b: Optional[_Record]) -> _Record:
+    if b is None:
+        return a
+    return a[0] - b[0], a[1] - b[1], a[2] - b[2], tuple(x - y for x, y in zip(a[3], b[3]))
+
+
+def _percentile(histogram: Tuple[int, ...], fraction: float) -> Optional[float]:
+    samples = sum(histogram)
+    if not samples:
+        return None
+    threshold = fraction * samples
+    seen = 0
+    for index, n in enumerate(histogram):
+        seen += n
+        if seen >= threshold:
+            return round(_BASE * _GROWTH ** index, 3)
+    return None
+
+
+class _Shard:
+    """Counters written by exactly one thread; other threads only ever read them"""
+    __slots__ = ('buckets', 'totals')
+
+    def __init__(self):
+        self.buckets: Dict[int, Dict[str, _Record]] = {}
+        self.totals: Dict[str, _Record] = {}
+
+    def record(self, name: str, ok: bool, seconds: Optional[float], now: float):
+        epoch = int(now // BUCKET_SECONDS)
+        bucket = self.buckets.get(epoch)
+        if bucket is None:
+            bucket = self.buckets[epoch] = {}
+            for old in [e for e in self.buckets if e <= epoch - _RETAIN_BUCKETS]:
+                del self.buckets[old]
+        bucket[name] = _add(bucket.get(name), ok, seconds)
+        self.totals[name] = _add(self.totals.get(name), ok, seconds)
+
+
+class StatsRecorder:
+    """Sharded request/upstream statistics with 1m/5m/1h windows
+
+    Each thread (the event loop, every to_thread worker) writes only to its own shard, so
+    recording takes no lock. Snapshots copy each shard's dicts (atomic under the GIL) and
+    merge them; a lock is only taken the first time a thread creates its shard. Reset
+    records a baseline instead of clearing counters that other threads are writing.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        # Totals and the then-current bucket as of the last reset, subtracted from later snapshots
+        self._baseline: Tuple[float, Dict[str, _Record], Dict[str, _Record]] = (time.time(), {}, {})
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards = self._shards + [shard]
+        return shard
+
+    def record(self, name: str, seconds: Optional[float] = None, ok: bool = True):
+        """Count one operation, with its latency when known"""
+        self._shard().record(name, ok, seconds, time.time())
+
+    def _totals(self) -> Dict[str, _Record]:
+        merged: Dict[str, _Record] = {}
+        for shard in self._shards:
+            for name, record in shard.totals.copy().items():
+                merged[name] = _merge(merged.get(name), record)
+        return merged
+
+    def _bucket(self, epoch: int) -> Dict[str, _Record]:
+        merged: Dict[str, _Record] = {}
+        for shard in self._shards:
+            for name, record in shard.buckets.get(epoch, {}).copy().items():
+                merged[name] = _merge(merged.get(name), record)
+        return merged
+
+    def reset(self):
+        """Start counting from zero without touching counters other threads are writing"""
+        now = time.time()
+        self._baseline = (now, self._totals(), self._bucket(int(now // BUCKET_SECONDS)))
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        reset_at, base_totals, base_bucket = self._baseline
+        current_epoch, reset_epoch = int(now // BUCKET_SECONDS), int(reset_at // BUCKET_SECONDS)
+
+        # Merge every shard's buckets per window; buckets from before a reset are skipped and
+        # the one the reset fell into only counts what was recorded after it
+        windows: Dict[str, Dict[str, _Record]] = {label: {} for label in WINDOWS}
+        for shard in self._shards:
+            for epoch, bucket in shard.buckets.copy().items():
+                if epoch < reset_epoch:
+                    continue
+                age = (current_epoch - epoch) * BUCKET_SECONDS
+                for label, span in WINDOWS.items():
+                    if age < span:
+                        merged = windows[label]
+                        for name, record in bucket.copy().items():
+                            merged[name] = _merge(merged.get(name), record)
+        reset_age = (current_epoch - reset_epoch) * BUCKET_SECONDS
+        for label, span in WINDOWS.items():
+            if reset_age < span:
+                merged = windows[label]
+                for name in merged:
+                    merged[name] = _subtract(merged[name], base_bucket.get(name))
+
+        result = {'since': reset_at, 'windows': {}, 'totals': {}}
+        for label, metrics in windows.items():
+            span = min(WINDOWS[label], max(now - reset_at, BUCKET_SECONDS))
+            result['windows'][label] = {
+                name: self._describe(record, span) for name, record in sorted(metrics.items()) if record[0]
+            }
+
+        for name, record in sorted(self._totals().items()):
+            record = _subtract(record, base_totals.get(name))
+            if record[0]:
+                result['totals'][name] = self._describe(record, None)
+        return result
+
+    @staticmethod
+    def _describe(record: _Record, span: Optional[float]) -> Dict:
+        count, errors, total, histogram = record
+        timed = sum(histogram)
+        description = {
+            'count': count,
+            'errors': errors,
+            'success_rate': round((count - errors) / count, 4) if count else None,
+            'avg_latency': round(total / timed, 3) if timed else None,
+            'p50_latency': _percentile(histogram, 0.50),
+            'p95_latency': _percentile(histogram, 0.95),
+            'p99_latency': _percentile(histogram, 0.99)
+        }
+        if span is not None:
+            description['throughput_per_min'] = round(count * 60 / span, 2)
+        return description